@@ -13,10 +13,33 @@
 # v0.20 June 22, 2011.  Now works with both Python 2.6 and Python 3.1
 # v0.21 June 2, 2013. Changed default viewer to eog, rather than inkscape
 # v0.22 February 6, 2025.  2to3 simpleSVG.py -w ; reindent simpleSVG.py
+# v0.23 NumPy arrays accepted by pathdata, path, draw and poly (numpy is optional); separate x and y by draw(x=...,y=...)
+#       scatter, for many plot symbols defined once with <defs> and placed with <use>
+#       windbarb_field, for wind barbs on a whole grid
+#       output to file objects and gzip (.svgz) through a buffered svg_sink; with statement
+#       memoized style strings, optionally written once as css classes
+#       svg_transform for user coordinates, nested coordinates with subscale
+#       simplify= for draw, poly and path, to decimate long polylines
+#       scale(cull=True) culls and clips to the plot area
+#       render_batch, for many figures rendered in a pool of processes
+#       very large paths streamed to the file, optionally formatted by a pool of processes
+#       retained mode, with layers that are serialized again only when changed
+#       svg_template, to start many documents from a common beginning
+#       compact encoding, with relative path coordinates and trimmed numbers
+#       optional stats of calls, time and bytes, given to an onclose hook; verbose=False for a quiet close
+#       hires makes a fixed point svg_pt rather than a Fraction; hiresarray for arrays of pts
+#       pcolor, for shading a grid of cells, with same coloured cells merged, or as an embedded png
+#       contour and contourf, by marching squares, one path for each level
+#       svg_stream, the document as an iterator or async iterator of chunks of bytes while it is drawn
+#       declutter=True, text labels are moved or dropped so that they do not overlap
+#       tiles=maxzoom and write_tiles, for a pyramid of svg tiles of a large document
 ####
 
 
-import os,sys
+import os,re,sys,time
+import gzip,io
+import base64,struct,zlib
+import collections,copy,traceback,threading
 from math import *
 #from __future__ import print_function
 display_prog = 'eog' #command to display images, using optional display() method
@@ -25,14 +48,436 @@ pyvers=sys.version_info[0]
 if pyvers >=3:
     import fractions
     fractype=type(fractions.Fraction(1,2))
+try:
+    import queue
+except ImportError: #Python 2
+    import Queue as queue
+try: #numpy is optional, it enables the fast path for arrays of coordinates
+    import numpy
+except ImportError:
+    numpy=None
+
+def fspath(dest): #a file name as str, e.g. from a pathlib.Path; other destinations are returned unchanged
+    if hasattr(os,'PathLike') and isinstance(dest,os.PathLike): return os.fspath(dest)
+    return dest
+
+class svg_sink: #buffered output for svg_class, to a file name or path, a writable file object, or gzip for .svgz
+    def __init__(self,dest,compress=None,bufsize=65536):
+        dest=fspath(dest)
+        self.bufsize=bufsize
+        self.buf=[] #strings not yet written
+        self.size=0 #characters in buf
+        self.closed=False
+        self.owned=None #file opened here, to be closed by close()
+        self.iotime=None #seconds spent writing to the file, if set to 0. to be timed
+        if compress is None: compress=isinstance(dest,str) and dest.endswith('.svgz')
+        if isinstance(dest,str):
+            if compress: self.owned=gzip.open(dest,'wb')
+            else: self.owned=open(dest,'w')
+            self.f=self.owned
+        elif compress: #gzip stream on top of the file object, which is left open
+            self.owned=gzip.GzipFile(fileobj=dest,mode='wb')
+            self.f=self.owned
+        else:
+            self.f=dest
+        if isinstance(self.f,io.TextIOBase): self.binary=False
+        elif isinstance(self.f,(io.RawIOBase,io.BufferedIOBase)): self.binary=True
+        else: self.binary='b' in str(getattr(self.f,'mode','b'))
+
+    def write(self,s):
+        self.buf.append(s)
+        self.size+=len(s)
+        if self.size>=self.bufsize: self.flush()
+
+    def flush(self):
+        if self.buf:
+            s="".join(self.buf)
+            if self.iotime is None:
+                self.f.write(s.encode('utf-8') if self.binary else s)
+            else:
+                t=time.perf_counter()
+                self.f.write(s.encode('utf-8') if self.binary else s)
+                self.iotime+=time.perf_counter()-t
+            self.buf=[]
+            self.size=0
+
+    def close(self):
+        self.flush()
+        if self.iotime is not None: t=time.perf_counter()
+        if self.owned is not None: self.owned.close()
+        elif hasattr(self.f,'flush'): self.f.flush()
+        if self.iotime is not None: self.iotime+=time.perf_counter()-t
+        self.closed=True
+
+class svg_pt: #hi-res svg coordinate in pts, as made by hires, stored as an integer number of hundredths of a pt
+#Arithmetic with svg_pt or int (pts) gives svg_pt, rounded to hundredths; with other numbers it gives a float.
+    __slots__=('n',)
+    def __init__(self,n): #n is in hundredths of a pt
+        self.n=n
+
+    def __float__(self):
+        return self.n/100.
+
+    def __int__(self):
+        return int(self.n/100.)
+
+    def __repr__(self):
+        return "hires(%r)" % (self.n/100.)
+
+    def __bool__(self): #hires(0) is false, as 0 is
+        return self.n!=0
+    __nonzero__=__bool__
+
+    def __reduce__(self): #for pickle and copy
+        return (svg_pt,(self.n,))
+
+    def __hash__(self):
+        return hash(self.n/100.)
+
+    def __eq__(self,o): return float(self)==o
+    def __ne__(self,o): return float(self)!=o
+    def __lt__(self,o): return float(self)<o
+    def __le__(self,o): return float(self)<=o
+    def __gt__(self,o): return float(self)>o
+    def __ge__(self,o): return float(self)>=o
+    def __neg__(self): return svg_pt(-self.n)
+    def __pos__(self): return self
+    def __abs__(self): return svg_pt(abs(self.n))
+
+    def __add__(self,o):
+        if type(o) is svg_pt: return svg_pt(self.n+o.n)
+        if type(o) is int: return svg_pt(self.n+100*o)
+        return self.n/100.+o
+    __radd__=__add__
+
+    def __sub__(self,o):
+        if type(o) is svg_pt: return svg_pt(self.n-o.n)
+        if type(o) is int: return svg_pt(self.n-100*o)
+        return self.n/100.-o
+
+    def __rsub__(self,o):
+        if type(o) is int: return svg_pt(100*o-self.n)
+        return o-self.n/100.
+
+    def __mul__(self,o):
+        if type(o) is svg_pt: return svg_pt(int(round(self.n*o.n/100.)))
+        if type(o) is int: return svg_pt(self.n*o)
+        return self.n/100.*o
+    __rmul__=__mul__
+
+    def __truediv__(self,o):
+        if type(o) is svg_pt: return svg_pt(int(round(100.*self.n/o.n)))
+        if type(o) is int: return svg_pt(int(round(self.n/float(o))))
+        return self.n/100./o
+    __div__=__truediv__
+
+    def __rtruediv__(self,o):
+        if type(o) is int: return svg_pt(int(round(10000.*o/self.n)))
+        return o/(self.n/100.)
+    __rdiv__=__rtruediv__
+
+if numpy is not None:
+    class svg_ptarray(numpy.ndarray): #numpy array of pts, as made by hiresarray, rather than of user coordinates
+        pass
+else:
+    class svg_ptarray: #never instantiated without numpy
+        pass
+
+class svg_transform: #immutable mapping of user coordinates to svg pts, as made by svg_class.scale
+#x pts = i0+(x-xmin)*xscale ,  y pts = j0-(jb+(y-ymin)*yscale)
+#floats are user coordinates, complex numbers are fractions of the bounding box, hi-res coordinates
+#and integers are pts, as documented in svg_class.ix and svg_class.jy
+    __slots__=('xmin','xmax','ymin','ymax','xscale','yscale','i0','j0','jb','bbx','bby')
+    def __init__(self,xmin,xmax,ymin,ymax,xscale,yscale,i0,j0,jb,bbx,bby):
+        for q,v in zip(self.__slots__,(xmin,xmax,ymin,ymax,xscale,yscale,i0,j0,jb,bbx,bby)):
+            object.__setattr__(self,q,v)
+
+    def __setattr__(self,q,v):
+        raise AttributeError("svg_transform is immutable")
+
+    def __reduce__(self): #for pickle and copy
+        return (self.__class__,tuple([getattr(self,q) for q in self.__slots__]))
+
+    def ix(self,x): #svg x coordinate in pts
+        t=type(x)
+        if t is float: return self.i0+(x-self.xmin)*self.xscale
+        if t is int: return x
+        if t is svg_pt: return x.n/100.
+        if isinstance(x,float): return self.i0+(x-self.xmin)*self.xscale
+        if isinstance(x,complex): return x.imag*self.bbx
+        if pyvers<3 and isinstance(x,long): return x*.01
+        if pyvers>=3 and t is fractype: return float(x)
+        return x
+
+    def jy(self,y): #svg y coordinate in pts
+        t=type(y)
+        if t is float: return self.j0-(self.jb+(y-self.ymin)*self.yscale)
+        if t is int: return y
+        if t is svg_pt: return y.n/100.
+        if isinstance(y,float): return self.j0-(self.jb+(y-self.ymin)*self.yscale)
+        if isinstance(y,complex): return y.imag*self.bby
+        if pyvers<3 and isinstance(y,long): return y*.01
+        if pyvers>=3 and t is fractype: return float(y)
+        return y
+
+    def sx(self,x): #pt size of user x size
+        t=type(x)
+        if t is float: return x*self.xscale
+        if t is int: return x
+        if t is svg_pt: return x.n/100.
+        if isinstance(x,float): return x*self.xscale
+        if isinstance(x,complex): return x.imag*self.bbx
+        if pyvers<3 and isinstance(x,long): return x*.01
+        if pyvers>=3 and t is fractype: return float(x)
+        return x
+
+    def sy(self,y): #pt size of user y size
+        t=type(y)
+        if t is float: return -y*self.yscale #note minus sign!!
+        if t is int: return y
+        if t is svg_pt: return y.n/100.
+        if isinstance(y,float): return -y*self.yscale
+        if isinstance(y,complex): return y.imag*self.bby
+        if pyvers<3 and isinstance(y,long): return y*.01
+        if pyvers>=3 and t is fractype: return float(y)
+        return y
+
+    def apply(self,x,y): #svg (x,y) in pts of a user point
+        return self.ix(x),self.jy(y)
+
+    def apply_flat(self,b,rel=False): #flat list x,y,x,y,... of user coordinates to a list of pts; rel for sizes
+        v=[]
+        if rel:
+            fx,fy,xs,ys=self.sx,self.sy,self.xscale,self.yscale
+            for n in range(0,len(b)-1,2):
+                x=b[n]
+                y=b[n+1]
+                v.append(x*xs if type(x) is float else fx(x))
+                v.append(-y*ys if type(y) is float else fy(y))
+        else:
+            fx,fy,i0,xmin,xs=self.ix,self.jy,self.i0,self.xmin,self.xscale
+            j0,jb,ymin,ys=self.j0,self.jb,self.ymin,self.yscale
+            for n in range(0,len(b)-1,2):
+                x=b[n]
+                y=b[n+1]
+                v.append(i0+(x-xmin)*xs if type(x) is float else fx(x))
+                v.append(j0-(jb+(y-ymin)*ys) if type(y) is float else fy(y))
+        return v
+
+    def apply_many(self,q,rel=False): #numpy array of coordinate pairs to an N x 2 float array of pts; rel for sizes
+        if isinstance(q,svg_ptarray): return numpy.array(q,dtype=float).reshape(-1,2) #pts
+        q=numpy.asarray(q).reshape(-1,2)
+        p=numpy.empty(q.shape)
+        x,y=q[:,0],q[:,1]
+        if q.dtype.kind=='f': #user coordinates
+            x,y=x.astype(float),y.astype(float)
+            if rel:
+                p[:,0]=x*self.xscale
+                p[:,1]=-y*self.yscale #note minus sign!!
+            else:
+                p[:,0]=self.i0+(x-self.xmin)*self.xscale
+                p[:,1]=self.j0-(self.jb+(y-self.ymin)*self.yscale)
+        elif q.dtype.kind=='c': #fraction of the bounding box
+            p[:,0]=x.imag*self.bbx
+            p[:,1]=y.imag*self.bby
+        else: #integers are pts
+            p[:,0]=x
+            p[:,1]=y
+        return p
+
+    def matrix(self): #(a,b,c,d,e,f) of the svg matrix() equivalent to this transform
+        return (self.xscale,0.,0.,-self.yscale,self.i0-self.xmin*self.xscale,
+                self.j0-self.jb+self.ymin*self.yscale)
+
+    def nest(self,xmin,xmax,ymin,ymax,x1,x2,y1,y2): #transform for new user coordinates, which fill the
+        i1,i2=self.ix(float(x1)),self.ix(float(x2))   #rectangle x1,y1,x2,y2 of these user coordinates
+        j1,j2=self.jy(float(y1)),self.jy(float(y2))
+        return svg_transform(xmin,xmax,ymin,ymax,float(i2-i1)/(xmax-xmin),float(j1-j2)/(ymax-ymin),
+                i1,j1,0,self.bbx,self.bby)
+
+#Retained mode: with svg_class(retained=True) the primitives are recorded in layers, rather than written,
+#and render or close writes the document.  Only layers changed since the previous render are serialized again,
+#the others are copied from their cached text.  Arguments are stored by reference, so arrays should not be
+#changed after they are drawn.  Layers should leave the transform and open groups as they found them.
+def primitive(f): #primitive writing to the document, recorded in the current layer in retained mode
+    kind=f.__name__
+    def recorded(self,*a,**k):
+        if self.recording:
+            lay=self.current
+            lay.nodes.append(svg_node(kind,a,k))
+            lay.dirty=True
+            return
+        if self.tiles is not None and not self.tiledepth: return self.tiled(kind,f,a,k)
+        if self.stats is not None: return self.counted(kind,f,a,k)
+        return f(self,*a,**k)
+    recorded.__name__=kind
+    recorded.__doc__=f.__doc__
+    return recorded
+
+def stateful(f): #like primitive, but also run when recorded, because it changes the state of svg_class
+    kind=f.__name__
+    def recorded(self,*a,**k):
+        if self.recording:
+            lay=self.current
+            lay.nodes.append(svg_node(kind,a,k))
+            lay.dirty=True
+            self.recording=False
+            try:
+                return f(self,*a,**k)
+            finally:
+                self.recording=True
+        if self.tiles is not None and not self.tiledepth: return self.tiled(kind,f,a,k,'state')
+        if self.stats is not None: return self.counted(kind,f,a,k,'state')
+        return f(self,*a,**k)
+    recorded.__name__=kind
+    recorded.__doc__=f.__doc__
+    return recorded
+
+#Stats: with svg_class(stats=True), or an onclose hook, svg_class.stats is a dict of
+#  calls: number of calls of each drawing primitive, including those made by other primitives
+#  state: number of calls of each change of state, such as scale and settransform, which are not timed as primitives
+#  time: seconds in transform (user coordinates to pts), format (pathdata and style strings), io (writing the file),
+#    and primitives (the outermost primitives, which includes their transform and format time)
+#  levels: characters and elements written at each group nesting level, 0 being outside of all groups
+#  bytes, elements: the totals of levels, as characters before any gzip
+#In retained mode, the document written by close is counted, each layer at the level where it ends.  Transforms are slower while stats are kept.
+def timed(cat): #method of svg_class timed in stats['time'][cat], if stats are kept; nested timed calls are not
+    def deco(f):
+        def g(self,*a,**k):
+            if self.stats is None or self.timing: return f(self,*a,**k)
+            self.timing=True
+            t=time.perf_counter()
+            try:
+                return f(self,*a,**k)
+            finally:
+                self.stats['time'][cat]+=time.perf_counter()-t
+                self.timing=False
+        g.__name__=f.__name__
+        g.__doc__=f.__doc__
+        return g
+    return deco
+
+class svg_node: #a recorded call of a primitive
+    __slots__=('kind','args','kw')
+    def __init__(self,kind,args,kw):
+        self.kind=kind
+        self.args=args
+        self.kw=kw
+
+class svg_layer: #named sequence of recorded primitives, and its serialization from the previous render
+    __slots__=('name','nodes','dirty','text','groups','markers')
+    def __init__(self,name):
+        self.name=name
+        self.nodes=[]
+        self.dirty=True
+        self.text=""
+        self.groups=0 #groups opened and not closed by the layer
+        self.markers={} #plot symbols defined in the layer
+
+    def clear(self): #remove all primitives, e.g. to draw the next frame of an animation
+        self.nodes=[]
+        self.dirty=True
+
+    def touch(self): #serialize again at the next render, e.g. after changing arrays that were drawn
+        self.dirty=True
+
+class svg_template: #beginning of a document, with the state of its svg_class, made by svg_class.template
+    def __init__(self,text,state):
+        self.text=text
+        self.state=state #attributes of svg_class, such as group_count, transform and markers
+
+    def new(self,fname="temp.svg",**k): #a new svg_class, which continues from the template
+        for q in k:
+            if q not in templateargs: raise TypeError("svg_template.new() got an unexpected keyword argument '%s'" % q)
+        return svg_class(fname,template=self,**k)
+
+maxstyles=4096 #memoized style strings kept by an svg_class, see stylestr
+
+templateargs=('compress','bufsize','workers','stats','onclose','verbose') #keywords of svg_class for a document from a template
+templateskip=('svg','fname','pool','workers','ix','jy','sx','sy','stats','onclose','verbose') #attributes of svg_class not kept in a template
 
 class svg_class:
-    def __init__(self,fname="temp.svg",bbx=512,bby=512,whiteback=True):
-        self.fname = fname
+    def __init__(self,fname="temp.svg",bbx=512,bby=512,whiteback=True,
+                    compress=None, #gzip the output (.svgz); default is True for file names ending in .svgz
+                    bufsize=65536, #characters buffered before they are written to fname
+                    cssclasses=False, #write each distinct style once, in a <style> block of classes
+                    workers=0, #processes for formatting very large paths, see parallel_threshold
+                    retained=False, #record primitives in layers, see primitive
+                    template=None, #an svg_template to start from, instead of a new document; only templateargs may be given with it
+                    compact=False, #shorter numbers and relative path coordinates, see compactgroups
+                    precision=2, #decimal places of numbers, if compact
+                    stats=False, #keep svg_class.stats, see timed
+                    onclose=None, #called with the stats by close, implies stats=True
+                    verbose=True, #close reports on stdout
+                    declutter=False, #text is placed only where it overlaps no other text, see placelabel
+                    tiles=None): #maxzoom of the index for write_tiles, see tiled
+        if template is not None and (bbx,bby,whiteback,cssclasses,compact,precision,declutter)!=(512,512,True,False,False,2,False):
+            raise TypeError("the document options of svg_class with a template are those of the template, only %s may be given" % ", ".join(templateargs))
+        self.fname = fspath(fname) #a file name or path, or any writable file object such as io.BytesIO
         self.bbx = int(bbx)
         self.bby = int(bby)
-        self.svg=open(self.fname,'w')
+        self.svg=svg_sink(self.fname,compress,bufsize)
+        self.recording=False #primitives are recorded, not written, in retained mode
+        self.stats=None
+        if stats or onclose is not None:
+            self.stats={'calls':{},'state':{},'time':{'transform':0.,'format':0.,'io':0.,'primitives':0.},'levels':{}}
+            self.svg.iotime=0.
+        self.onclose=onclose
+        self.verbose=verbose
+        self.timing=False #inside a timed method
+        self.depth=0 #nesting of primitives, while stats are kept
+        self.declutter=declutter
+        self.labels={} #boxes of the placed text in pts, in cells of labelcell pts
+        if tiles is not None and (retained or template is not None):
+            raise ValueError("tiles is not available in retained mode or with a template")
+        self.tiles=tiles
+        self.tiledepth=0 #inside the outermost primitive, while tiles are kept
+        self.tileskip=0 #coordinates are not in the page coordinates, e.g. of a glyph
+        self.tilebuf=[] #written since the last item
+        self.tileitems=[] #(box in pts or None,text,thinned), in the order of the document
+        self.tilebuckets={} #indices of items in cells of the page, 2**tiles cells on a side
+        self.tilebig=[] #indices of items in too many cells
+        self.tilerec=False
+        self.tilestart()
+        self.countwrites(self.svg)
         self.group_count=0
+        self.markers={} #ids of plot symbols defined for scatter, keyed by (marker,size)
+        self.styles={} #memoized style strings, keyed by the keyword arguments
+        self.cssclasses=cssclasses
+        self.classes={} #class names of style strings, if cssclasses
+        self.transforms=[] #stack of svg_transform, see pushtransform
+        self.cliprect=None #plot area in pts, if culling was requested by scale
+        self.cullskip=0 #coordinates are not in the page coordinates, e.g. of a glyph, so nothing is culled
+        self.workers=workers
+        self.pool=None #started when the first large path is formatted
+        self.settransform(svg_transform(0.,1.,0.,1.,float(self.bbx),float(self.bby),0,self.bby,0,self.bbx,self.bby)) #until scale is called
+        self.markercount=0 #for ids of plot symbols
+        self.retained=retained
+        if compact and numpy is None: raise ImportError("compact requires numpy")
+        self.compact=compact
+        self.precision=precision
+        self.bytes_saved=0 #estimated bytes of pathdata saved by compact
+        self.lastcommand=None
+        if template is not None: #the state and text of the template, without any drawing
+            self.__dict__.update(copy.deepcopy(template.state))
+            self.settransform(self.transform)
+            self.svg.write(template.text)
+            return
+        if retained:
+            self.output=self.svg #written by render
+            self.svg=svg_sink(io.StringIO()) #takes any direct writes while recording
+            self.layers=[]
+            self.layer('base')
+            self.recording=True
+        else:
+            self.svg.write(self.header())
+            if tiles is not None: self.tilerecord(self.svg)
+        if whiteback: self.rect(0,0,self.bbx,self.bby,fill="white")
+        self.group(fill_opacity=1., fill="none", stroke="black", stroke_width=1,
+font_size="10pt", font_family="Arial, sans-serif")
+#               self.scale() # after v.12, scale must be called explicitly, to prevent clipPath from premature definition
+
+    def header(self):
         header = """<?xml version="1.0"?>
 <!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN"
 "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">
@@ -43,26 +488,147 @@ xmlns="http://www.w3.org/2000/svg"
 version="1.0"
 height="%d" width="%d">
 """ % (self.bby,self.bbx)
-        self.svg.write(header)
-        if whiteback: self.rect(0,0,self.bbx,self.bby,fill="white")
-        self.group(fill_opacity=1., fill="none", stroke="black", stroke_width=1,
-font_size="10pt", font_family="Arial, sans-serif")
-#               self.scale() # after v.12, scale must be called explicitly, to prevent clipPath from premature definition
+        return header
 
-    def close(self):
-        while self.group_count>=1: self.group()
+    def tail(self): #end of the document, after all groups are closed
         endfile = "</svg>\n"
-        self.svg.write(endfile)
-        sys.stdout.write("The file "+self.fname+" was successfully written and closed by simpleSVG\n")
-        self.svg.close()
-        return
+        if self.classes: #the styles of the whole document
+            css="".join([".%s{%s}\n" % (c,t) for t,c in self.classes.items()])
+            endfile='<style type="text/css"><![CDATA[\n'+css+']]></style>\n'+endfile
+        return endfile
+
+    def close(self): #returns the stats, if kept
+        if self.retained:
+            if self.output.closed: return self.stats
+            self.renderto(self.output)
+            self.output.close()
+            sink=self.output
+        else:
+            if self.svg.closed: return self.stats
+            while self.group_count>=1: self.group()
+            if self.tiles is not None:
+                self.tileflush(None)
+                self.tilerec=False #the tiles have tails of their own
+            self.svg.write(self.tail())
+            self.svg.close()
+            sink=self.svg
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool=None
+        if self.stats is not None:
+            self.stats['time']['io']=sink.iotime
+            self.stats['bytes']=sum([c['bytes'] for c in self.stats['levels'].values()])
+            self.stats['elements']=sum([c['elements'] for c in self.stats['levels'].values()])
+            if self.onclose is not None: self.onclose(self.stats)
+        if self.verbose:
+            if isinstance(self.fname,str): name=self.fname
+            else: name=repr(self.fname)
+            sys.stdout.write("The file "+name+" was successfully written and closed by simpleSVG\n")
+        return self.stats
+
+    def countwrites(self,sink): #count the characters and elements written to sink at each group level, if stats are kept
+        if self.stats is None: return sink
+        write=sink.write
+        levels=self.stats['levels']
+        def counted(s):
+            c=levels.get(self.group_count)
+            if c is None: c=levels[self.group_count]={'bytes':0,'elements':0}
+            c['bytes']+=len(s)
+            if '<' in s: c['elements']+=s.count('<')-s.count('</')-s.count('<!')-s.count('<?')
+            write(s)
+        sink.write=counted
+        return sink
+
+    def counted(self,kind,f,a,k,key='calls'): #run f, counting the call in stats[key], and timing it if it is the outermost primitive
+        calls=self.stats[key]
+        calls[kind]=calls.get(kind,0)+1
+        if self.depth or key!='calls': return f(self,*a,**k)
+        self.depth=1
+        t=time.perf_counter()
+        try:
+            return f(self,*a,**k)
+        finally:
+            self.stats['time']['primitives']+=time.perf_counter()-t
+            self.depth=0
+
+    def template(self): #snapshot of the document so far, for svg_class(template=...) or svg_template.new
+        if self.retained or self.tiles is not None: raise ValueError("template is not available in retained mode or with tiles")
+        self.svg.flush()
+        f=self.svg.f
+        if self.svg.owned is None and hasattr(f,'getvalue'): #in memory
+            text=f.getvalue()
+            if not isinstance(text,str): text=text.decode('utf-8')
+        elif isinstance(self.fname,str) and not isinstance(f,gzip.GzipFile): #read back from the file
+            f.flush()
+            with open(self.fname) as g: text=g.read()
+        else:
+            raise ValueError("template needs an uncompressed file name or an in-memory file object")
+        state={}
+        for q,v in self.__dict__.items():
+            if q not in templateskip: state[q]=v
+        return svg_template(text,copy.deepcopy(state))
+
+    def __enter__(self): #with svg_class(...) as a: closes the file at the end of the block
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def layer(self,name=None): #retained mode: select the layer name for the next primitives, or the current layer
+        if name is None: return self.current
+        for lay in self.layers:
+            if lay.name==name: break
+        else:
+            lay=svg_layer(name)
+            self.layers.append(lay)
+        self.current=lay
+        return lay
+
+    def render(self,dest=None,compress=None): #retained mode: write the document to dest, a file name or file object
+        if dest is None: #return the document as a string
+            out=svg_sink(io.StringIO())
+            self.renderto(out)
+            out.flush()
+            return out.f.getvalue()
+        out=svg_sink(dest,compress)
+        self.renderto(out)
+        out.close()
+
+    def renderto(self,out): #write the document to the svg_sink out, serializing the changed layers
+        scratch,markers=self.svg,self.markers
+        self.recording=False
+        self.group_count=0
+        self.labels={} #text is placed again in the layers serialized now
+        try:
+            out.write(self.header())
+            for lay in self.layers:
+                if lay.dirty:
+                    self.svg=svg_sink(io.StringIO())
+                    self.markers=lay.markers={}
+                    g=self.group_count
+                    for n in lay.nodes: getattr(self,n.kind)(*n.args,**n.kw)
+                    self.svg.flush()
+                    lay.text=self.svg.f.getvalue()
+                    lay.groups=self.group_count-g
+                    lay.dirty=False
+                else:
+                    self.group_count+=lay.groups
+                out.write(lay.text)
+            out.write('</g>\n'*self.group_count)
+            out.write(self.tail())
+        finally:
+            self.group_count=0
+            self.svg,self.markers=scratch,markers
+            self.recording=True
 
     def display(self,prog=display_prog):
         os.system("%s %s" % (prog,self.fname))
         return
 
+    @stateful
     def scale(self,xmin=0.,xmax=1.,ymin=0.,ymax=1., #sets the user coordinates
-                    leftmarg=50,rightmarg=50,botmarg=50,topmarg=50):
+                    leftmarg=50,rightmarg=50,botmarg=50,topmarg=50,
+                    cull=False): #line, circle, draw, poly and path are culled or clipped to the plot area
         self.xmin=xmin
         self.xmax=xmax
         self.ymin=ymin
@@ -73,180 +639,599 @@ font_size="10pt", font_family="Arial, sans-serif")
         self.topmarg=topmarg
         self.xscale=float(self.bbx-self.leftmarg-self.rightmarg)/(self.xmax-self.xmin)
         self.yscale=float(self.bby-self.botmarg -self.topmarg  )/(self.ymax-self.ymin)
+        self.settransform(svg_transform(xmin,xmax,ymin,ymax,self.xscale,self.yscale,
+                leftmarg,self.bby,botmarg,self.bbx,self.bby))
         clippath="""<defs><clipPath id="marginmask">
 <rect x="%d" y="%d" width="%d" height="%d" />
 </clipPath></defs>
 """ % (
 self.leftmarg, self.topmarg, self.bbx-self.leftmarg-self.rightmarg, self.bby-self.topmarg-self.botmarg)
         self.svg.write(clippath)
+        if cull: self.cliprect=(leftmarg,topmarg,self.bbx-rightmarg,self.bby-botmarg) #in pts
+        else: self.cliprect=None
+
+    @timed('format')
+    def stylestr(self,k): #style string from keyword arguments k, which are prepended by k['style']
+        try:
+            key=tuple((q,type(v),v) for q,v in k.items()) #with the type, since 1, 1.0 and True are equal keys
+            return self.styles[key]
+        except KeyError:
+            pass
+        except TypeError: #unhashable value, not memoized
+            key=None
+        style=k.pop('style',"")
+        for q in k.keys(): style+=q.replace('_','-')+':'+str(k[q])+';'
+        if key is not None:
+            if len(self.styles)>=maxstyles: self.styles.clear() #e.g. a style per element, bounded
+            self.styles[key]=style
+        return style
 
+    def styleattr(self,style): #the style attribute for an element, or its class if cssclasses
+        if not self.cssclasses: return 'style="'+style+'" '
+        c=self.classes.get(style)
+        if c is None:
+            c=self.classes[style]="s%d" % len(self.classes)
+        return 'class="'+c+'" '
+
+#ix, jy, sx and sy are bound to the methods of the current svg_transform by settransform,
+#so primitives do not pay for an extra call, unless stats or tiles are kept
+    @timed('transform')
     def ix(self,x): #svg x coordinate in pts as function of various types of user "x"
-        if isinstance(x,float):
-            return self.leftmarg+(x-self.xmin)*self.xscale
-        elif isinstance(x,complex):
-            return x.imag*self.bbx
-        elif pyvers<3 and isinstance(x,long):
-            return x*.01
-        elif pyvers>=3 and type(x)==fractype:
-            return float(x)
-        else:
-            return x
+        i=self.transform.ix(x)
+        if self.tiles is not None and not self.tileskip: self.tilespan(i,None,i,None)
+        return i
 
+    @timed('transform')
     def jy(self,y): #svg y coordinate in pts as function of various types of user "y"
-        if isinstance(y,float):
-            return self.bby-(self.botmarg+(y-self.ymin)*self.yscale)
-        elif isinstance(y,complex):
-            return y.imag*self.bby
-        elif pyvers<3 and isinstance(y,long):
-            return y*.01
-        elif pyvers>=3 and type(y)==fractype:
-            return float(y)
-        else:
-            return y
+        j=self.transform.jy(y)
+        if self.tiles is not None and not self.tileskip: self.tilespan(None,j,None,j)
+        return j
 
 #sizes of things are scaled a bit differently from a position of a thing.
+    @timed('transform')
     def sx(self,x): #pt size for fonts, ticks, radius, relative displacement etc., as function of user "x" size
-        if isinstance(x,float):
-            return x*self.xscale
-        elif isinstance(x,complex):
-            return x.imag*self.bbx
-        elif pyvers<3 and isinstance(x,long):
-            return x*.01
-        elif pyvers>=3 and type(x)==fractype:
-            return float(x)
-        else:
-            return x
+        r=self.transform.sx(x)
+        if self.tiles is not None and not self.tileskip: self.tilepad+=abs(r)
+        return r
 
+    @timed('transform')
     def sy(self,y): #pt size for fonts, ticks, radius, relative displacement etc., as function of user "y" size
-        if isinstance(y,float):
-            return -y*self.yscale #note minus sign!!
-        elif isinstance(y,complex):
-            return y.imag*self.bby
-        elif pyvers<3 and isinstance(y,long):
-            return y*.01
-        elif pyvers>=3 and type(y)==fractype:
-            return float(y)
+        r=self.transform.sy(y)
+        if self.tiles is not None and not self.tileskip: self.tilepad+=abs(r)
+        return r
+
+    @stateful
+    def settransform(self,t): #use the svg_transform t for user coordinates
+        self.transform=t
+        if self.stats is None and self.tiles is None: self.ix,self.jy,self.sx,self.sy=t.ix,t.jy,t.sx,t.sy
         else:
-            return y
+            for q in ('ix','jy','sx','sy'): self.__dict__.pop(q,None) #the methods of svg_class
+        self.xmin,self.xmax,self.ymin,self.ymax=t.xmin,t.xmax,t.ymin,t.ymax #used by xaxis and yaxis
+        self.xscale,self.yscale=t.xscale,t.yscale
+
+    @stateful
+    def pushtransform(self,t): #use t until poptransform, e.g. for a panel of a multi-panel figure
+        self.transforms.append(self.transform)
+        self.settransform(t)
 
-    def pathdata(self,*a):
+    @stateful
+    def poptransform(self):
+        self.settransform(self.transforms.pop())
+
+    @stateful
+    def subscale(self,xmin,xmax,ymin,ymax,x1,x2,y1,y2): #nested user coordinates xmin..xmax,ymin..ymax filling
+        self.pushtransform(self.transform.nest(xmin,xmax,ymin,ymax,x1,x2,y1,y2)) #the user rectangle x1,y1,x2,y2
+
+    def pathdata(self,*a,**k):
+        return "".join(self.pathchunks(*a,**k))
+
+    def pathchunks(self,*a,**k): #generator of the pieces of the pathdata string, used by pathdata and path
+        simplify=k.pop('simplify',None) #optional decimation of absolute M and L coordinates, see simplified
+        if self.compact:
+            yield self.compactpath(a,simplify)
+            return
         b=[] #will store all the numbers and sequences of coordinates between the tags
-        s="" #a formatted string of all the coordinate pair numbers
-        d="" #the pathdata string, for use in <path d=...."
+        qz=None
         for q in a: #process items im parameter list
             if isinstance(q,str): #found a tag
                 if b: #process stored coordinate pairs in b
-                    bf=[x for x in flattn(b)] #flatten the coordinate array and float, flatten is a generator
-                    for n in range(0,int(len(bf)/2)):
-#                                               if (s): s+=", " #separate coordinate pairs by commas
-                        if (s): s+=" " #no comma works in more browsers and software
-                        x,y=bf[2*n:2*n+2]
-                        if qz in ('l','m'):#add formatted relative coordinate to string
-                            s+=" %.2f %.2f" % ( self.sx(x) , self.sy(y) )
-                        else:#add formatted absolute coordinate to string
-                            s+=" %.2f %.2f" % ( self.ix(x) , self.jy(y) )
+                    for s in self.pairchunks(b,qz,simplify): yield s
                     b=[] #empty the list of coordinate pairs
-                d+=s #add formatted coordinate pairs to pathdata
-                s="" #clear the string
-                d+=" "+q #finally add the tag to the string
+                yield " "+q #finally add the tag to the string
                 qz=q #store the tag
             else:
-                b.append(q) #assume item is coordinate, or list or tuple of coordinates
+                b.append(q) #assume item is coordinate, or list or tuple of coordinates, or numpy array
         if b: #end of the argument list has been reached, process b
-            bf=[x for x in flattn(b)]
-            for n in range(0,int(len(bf)/2)):
-#                               if (s): s+=", " #
-                if (s): s+=" " #works better than above
-                x,y=bf[2*n:2*n+2]
-                if qz in ('l','m'):#add formatted relative coordinate to string
-                    s+=" %.2f %.2f" % ( self.sx(x) , self.sy(y) )
-                else:#add formatted absolute coordinate to string
-                    s+=" %.2f %.2f" % ( self.ix(x) , self.jy(y) )
-            d+=s
+            for s in self.pairchunks(b,qz,simplify): yield s
+
+    def pairchunks(self,b,qz,simplify=None): #generator of the formatted coordinate pairs in b, which follow the tag qz
+        rel=qz in ('l','m') #relative coordinates
+        v=[] #pieces of svg coordinates in pts: flat lists, or N x 2 numpy arrays
+        c=[] #scalars, lists and tuples waiting to be flattened
+        n=0 #number of coordinates
+        for q in b:
+            if numpy is not None and isinstance(q,numpy.ndarray): #numpy arrays are transformed all at once
+                if c: v.append(self.ptflat([x for x in flattn(c)],rel))
+                c=[]
+                v.append(self.ptarray(q,rel))
+            else:
+                c.append(q)
+        if c: v.append(self.ptflat([x for x in flattn(c)],rel))
+        for q in v: n+=numpy.size(q) if numpy is not None else len(q)
+        if self.workers and not simplify and n>=2*parallel_threshold: #large, formatted by the pool in chunks
+            p=numpy.concatenate([numpy.asarray(q).reshape(-1,2) for q in v])
+            for s in self.parallelpairs(p): yield s
+            return
+        if len(v)==1 and isinstance(v[0],list): v=v[0]
+        else: v=[x for q in v for x in (q.ravel().tolist() if numpy is not None and isinstance(q,numpy.ndarray) else q)]
+        if simplify and qz in ('M','L') and len(v)>4:
+            v=simplified(numpy.array(v[:len(v)//2*2]).reshape(-1,2),simplify).ravel().tolist()
+        yield self.fmtpts(v)
+
+    @timed('format')
+    def fmtpts(self,v): #fmtpairs, timed
+        return fmtpairs(v)
+
+    def parallelpairs(self,p): #formatted pairs of the N x 2 array of pts p, in chunks from the pool of workers
+        if self.pool is None:
+            import concurrent.futures
+            self.pool=concurrent.futures.ProcessPoolExecutor(self.workers)
+        chunks=[p[m:m+parallel_chunk] for m in range(0,len(p),parallel_chunk)]
+        window=2*self.workers #chunks submitted ahead, to bound memory
+        futures=[self.pool.submit(fmtpairs,q) for q in chunks[:window]]
+        for m in range(len(chunks)):
+            s=futures[m].result()
+            futures[m]=None
+            if m+window<len(chunks): futures.append(self.pool.submit(fmtpairs,chunks[m+window]))
+            if m: yield " "+s #pairs are separated by a space, as in fmtpairs
+            else: yield s
+
+    def compactpath(self,a,simplify=None): #pathdata in the compact encoding, see svg_class(compact=True)
+        groups=[] #(tag,N x 2 array of pts or None)
+        b=[]
+        qz=None
+        for q in a:
+            if isinstance(q,str):
+                if b or qz is not None: groups.append((qz,self.grouppts(b,qz in ('l','m')) if b else None))
+                b=[]
+                qz=q
+            else:
+                b.append(q)
+        if b or qz is not None: groups.append((qz,self.grouppts(b,qz in ('l','m')) if b else None))
+        if simplify:
+            groups=[(q,simplified(p,simplify) if q in ('M','L') and p is not None and len(p)>2 else p) for q,p in groups]
+        return self.compactgroups(groups)
+
+    def grouppts(self,b,rel): #N x 2 numpy array of pts of the coordinate pairs in b
+        v=[]
+        c=[]
+        for q in b:
+            if isinstance(q,numpy.ndarray):
+                if c: v.append(numpy.array(self.ptflat([x for x in flattn(c)],rel)).reshape(-1,2))
+                c=[]
+                v.append(self.ptarray(q,rel))
+            else:
+                c.append(q)
+        if c: v.append(numpy.array(self.ptflat([x for x in flattn(c)],rel)).reshape(-1,2))
+        return numpy.concatenate(v)
+
+    @timed('format')
+    def compactgroups(self,groups): #compact pathdata of (tag,pts) groups: absolute L becomes relative l
+        m=10**self.precision
+        t=[] #tokens: command letters, other tags, and strings of numbers
+        cur=start=None #current point and start of the subpath, in units of 1/m pts, None if not known
+        default=0 #length of the pathdata in the default encoding
+        self.lastcommand=None
+        for q,p in groups:
+            if q is not None: default+=len(q)+1
+            Q=None
+            if p is not None and len(p):
+                default+=fixedlen(p)
+                Q=numpy.rint(p*m).astype(numpy.int64)
+            if q in ('M','L') and Q is not None:
+                if q=='M':
+                    self.compacttoken(t,'M',Q[:1])
+                    start=cur=Q[0]
+                    Q=Q[1:]
+                    if not len(Q): continue
+                if cur is not None:
+                    self.compacttoken(t,'l',numpy.diff(numpy.vstack((cur,Q)),axis=0))
+                else:
+                    self.compacttoken(t,'L',Q)
+                cur=Q[-1]
+            elif q in ('m','l'):
+                self.compacttoken(t,q,Q)
+                if Q is not None and cur is not None:
+                    if q=='m': start=cur+Q[0]
+                    cur=cur+Q.sum(axis=0)
+            elif q in ('Z','z'):
+                self.compacttoken(t,'z',Q)
+                cur=start
+            else: #other commands are kept as they are, and the current point is lost
+                self.compacttoken(t,q,Q)
+                cur=None
+        d=[]
+        for n in range(len(t)): #separate by spaces only where needed
+            if n and not (t[n-1] in pathcommands or t[n] in pathcommands or t[n][0]=='-'): d.append(' ')
+            d.append(t[n])
+        d="".join(d)
+        self.bytes_saved+=default-len(d)
         return d
 
+    def compacttoken(self,t,q,Q): #append command q and the numbers Q to the tokens t, omitting a repeated command
+        if q is not None:
+            if not (t and q not in 'Mm' and t[-1] not in pathcommands and q==self.lastcommand):
+                t.append(q)
+            if q in pathcommands: self.lastcommand=q
+        if Q is not None and len(Q): t.append(compactnums(Q.ravel(),self.precision))
+
+    def num(self,v): #number for an attribute, in the encoding of the document
+        if self.compact: return compactnum(v,self.precision)
+        return "%.2f" % v
+
+    @timed('format')
+    def ptpath(self,pieces,closed=False): #pathdata of polylines given as N x 2 arrays of pts
+        if not self.compact: return ptpathdata(pieces,closed)
+        groups=[]
+        for p in pieces:
+            groups+=[('M',p[:1]),('L',p[1:])]
+            if closed: groups.append(('Z',None))
+        return self.compactgroups(groups)
+
+    @timed('transform')
+    def ptarray(self,q,rel=False): #numpy array of coordinate pairs, as N x 2 float array of svg pts
+        p=self.transform.apply_many(q,rel)
+        if self.tiles is not None and not self.tileskip and len(p):
+            if rel: self.tilepad+=float(numpy.abs(p).sum(axis=0).max())
+            else: self.tilespan(float(p[:,0].min()),float(p[:,1].min()),float(p[:,0].max()),float(p[:,1].max()))
+        return p
+
+    @timed('transform')
+    def ptflat(self,b,rel=False): #flat list of user coordinates to a list of pts
+        v=self.transform.apply_flat(b,rel)
+        if self.tiles is not None and not self.tileskip and v:
+            if rel: self.tilepad+=max(sum([abs(q) for q in v[0::2]]),sum([abs(q) for q in v[1::2]]))
+            else: self.tilespan(min(v[0::2]),min(v[1::2]),max(v[0::2]),max(v[1::2]))
+        return v
+
+    def outside(self,a): #True if path arguments a are absolute M and L only, and entirely outside of cliprect
+        v=[] #pts
+        c=[] #scalars, lists and tuples
+        for q in a:
+            if isinstance(q,str):
+                if q not in ('M','L','Z','z'): return False
+            elif numpy is not None and isinstance(q,numpy.ndarray):
+                v.extend(self.ptarray(q).ravel().tolist())
+            else:
+                c.append(q)
+        v.extend(self.ptflat([x for x in flattn(c)]))
+        if len(v)<2: return False
+        x,y=v[0::2],v[1::2]
+        x0,y0,x1,y1=self.cliprect
+        return max(x)<x0 or min(x)>x1 or max(y)<y0 or min(y)>y1
+
+    def xyargs(self,a,x,y): #the arguments of draw or poly, with the points of separate x and y, draw(x=...,y=...), appended
+        if x is None and y is None: return a
+        if x is None or y is None or len(x)!=len(y): raise ValueError("x and y must be given together, and of equal length")
+        if numpy is not None and (isinstance(x,numpy.ndarray) or isinstance(y,numpy.ndarray)):
+            b=numpy.column_stack((x,y))
+            if isinstance(x,svg_ptarray) and isinstance(y,svg_ptarray): b=b.view(svg_ptarray) #pts stay pts
+            return a+(b,)
+        return a+([q for p in zip(x,y) for q in p],)
+
+    def xyarray(self,a): #N x 2 array from the arguments of draw or poly, None if there is no numpy array among them
+        if numpy is None or not [q for q in a if isinstance(q,numpy.ndarray)]: return None
+        b=numpy.concatenate([numpy.asarray(q).reshape(-1,2) for q in a]) #interleaved x,y, whatever the container
+        if not [q for q in a if not isinstance(q,svg_ptarray)]: b=b.view(svg_ptarray) #pts stay pts
+        return b
+
+    @primitive
     def path(self,*a,**k):
         d=k.pop('d',"")
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
-        if a: d+=self.pathdata(*a)
+        simplify=k.pop('simplify',None)
+        style=self.stylestr(k)
+        if a and self.cliprect is not None and not self.cullskip and self.outside(a): return
         p='<path '
-        if style: p+='style="'+style+'" '
-        self.svg.write(p+' d="'+d+'"/>\n')
+        if style: p+=self.styleattr(style)
+        if not self.compact: p+=' '
+        if not a:
+            self.svg.write(p+'d="'+d+'"/>\n')
+            return
+        self.svg.write(p+'d="'+d)
+        for q in self.pathchunks(*a,simplify=simplify): self.svg.write(q) #the pathdata is streamed to the file
+        self.svg.write('"/>\n')
 
+    @primitive
     def group(self,**k):
         if not k and self.group_count>=1:
             self.group_count-=1
             self.svg.write('</g>\n')
         else:
-            style=k.pop('style',"")
             transform=k.pop('transform',"")
             clippath=k.pop('clip_path',"")
-            for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
-            self.group_count+=1
+            style=self.stylestr(k)
             g='<g '
-            if style: g+='style="'+style+'" '
+            if style: g+=self.styleattr(style)
             if transform: g+='transform="'+transform+'" '
             if clippath: g+='clip-path="'+clippath+'" '
             self.svg.write(g+'>\n')
+            self.group_count+=1
+
+
+#Tiles: with svg_class(tiles=maxzoom), what each outermost primitive writes is kept as an item, with the box in pts
+#of the coordinates it transformed, or None if it has none, such as a group.  Items with a box are indexed in
+#2**maxzoom x 2**maxzoom cells of the page.  scatter and windbarb_field make an item of each point, which are thinned
+#at the lower zooms.  After close, write_tiles writes the document as tiles z/x/y.svg, for zooms 0 to maxzoom, which
+#divide the plot area of scale into 2**z x 2**z tiles, x from left and y from top.  A tile has the items without a box,
+#such as groups and definitions, and those whose box meets the tile, in the order of the document.
+    def tiled(self,kind,f,a,k,key='calls'): #run the outermost primitive f, and keep what it wrote as an item
+        self.tileflush(None) #written outside of any primitive
+        self.tiledepth=1
+        try:
+            if self.stats is not None: return self.counted(kind,f,a,k,key)
+            return f(self,*a,**k)
+        finally:
+            self.tiledepth=0
+            self.tileflush(self.tilebbox())
+
+    def tilerecord(self,sink): #keep what is written to sink in tilebuf, while tilerec
+        write=sink.write
+        buf=self.tilebuf
+        def recorded(s):
+            if self.tilerec: buf.append(s)
+            write(s)
+        sink.write=recorded
+        self.tilerec=True
 
+    def tilestart(self): #begin the box of the next item
+        self.tilebox=[float('inf'),float('inf'),-float('inf'),-float('inf')]
+        self.tilepad=0. #sizes transformed, which extend the box
+
+    def tilespan(self,x0,y0,x1,y1): #extend the box of the item by x0..x1 and y0..y1 in pts, None for no extent
+        b=self.tilebox
+        if x0 is not None:
+            if x0<b[0]: b[0]=x0
+            if x1>b[2]: b[2]=x1
+        if y0 is not None:
+            if y0<b[1]: b[1]=y0
+            if y1>b[3]: b[3]=y1
+
+    def tilearound(self,i,j,r): #extend the box of the item by the square of half width r in pts around i,j
+        self.tilespan(i-r,j-r,i+r,j+r)
+
+    def tilebbox(self): #box of the item in pts, or None if no coordinates were transformed
+        b=self.tilebox
+        if b[0]>b[2] and b[1]>b[3]: return None
+        x0,x1=(b[0],b[2]) if b[0]<=b[2] else (0.,float(self.bbx))
+        y0,y1=(b[1],b[3]) if b[1]<=b[3] else (0.,float(self.bby))
+        p=self.tilepad
+        return (x0-p,y0-p,x1+p,y1+p)
+
+    def tileflush(self,box,thin=False): #what was written since the last item becomes an item with the box
+        if self.tilebuf:
+            n=len(self.tileitems)
+            self.tileitems.append((box,"".join(self.tilebuf),thin))
+            del self.tilebuf[:]
+            if box is not None:
+                m=2**self.tiles
+                cx,cy=self.bbx/float(m),self.bby/float(m)
+                i0,i1=[min(max(int(q//cx),0),m-1) for q in (box[0],box[2])]
+                j0,j1=[min(max(int(q//cy),0),m-1) for q in (box[1],box[3])]
+                if (i1-i0+1)*(j1-j0+1)>64: self.tilebig.append(n)
+                else:
+                    for i in range(i0,i1+1):
+                        for j in range(j0,j1+1): self.tilebuckets.setdefault((i,j),[]).append(n)
+        self.tilestart()
+
+    def tilepoints(self,t,i,j,r): #the lines of t, one for each point i,j in pts, as items of half width r pts
+        self.tileflush(None) #such as definitions and the group of the points
+        for q,x,y in zip(t.splitlines(True),i,j):
+            self.tilebuf.append(q)
+            self.tileflush((x-r,y-r,x+r,y+r),True)
+        self.svg.write(t)
+        del self.tilebuf[:] #already kept
+
+    def tilerect(self): #plot area of scale in pts, x0,y0,x1,y1
+        t=self.transforms[0] if self.transforms else self.transform
+        x0,x1=sorted((t.ix(float(t.xmin)),t.ix(float(t.xmax))))
+        y0,y1=sorted((t.jy(float(t.ymin)),t.jy(float(t.ymax))))
+        return x0,y0,x1,y1
+
+    def tileindices(self,b,thin): #indices of the items in the tile b=(x0,y0,x1,y1) pts; thin is cells on a side, or 0
+        m=2**self.tiles
+        cx,cy=self.bbx/float(m),self.bby/float(m)
+        c=set(self.tilebig)
+        for i in range(min(max(int(b[0]//cx),0),m-1),min(max(int(b[2]//cx),0),m-1)+1):
+            for j in range(min(max(int(b[1]//cy),0),m-1),min(max(int(b[3]//cy),0),m-1)+1):
+                c.update(self.tilebuckets.get((i,j),()))
+        items=self.tileitems
+        c=[n for n in c if items[n][0][0]<b[2] and b[0]<items[n][0][2] and items[n][0][1]<b[3] and b[1]<items[n][0][3]]
+        if not c: return []
+        if thin: #the first point in each cell of the thinning grid
+            w,h=(b[2]-b[0])/thin,(b[3]-b[1])/thin
+            seen=set()
+            kept=[]
+            for n in sorted(c):
+                q=items[n]
+                if q[2]:
+                    key=(int((q[0][0]+q[0][2]-2*b[0])/(2*w)),int((q[0][1]+q[0][3]-2*b[1])/(2*h)))
+                    if key in seen: continue
+                    seen.add(key)
+                kept.append(n)
+            c=kept
+        return sorted(c+self.tilestructure)
+
+    def tileheader(self,b,tilesize): #beginning of a tile document, showing the box b in pts
+        w,h=b[2]-b[0],b[3]-b[1]
+        return self.header().replace('height="%d" width="%d">' % (self.bby,self.bbx),
+                'height="%d" width="%d" viewBox="%.2f %.2f %.2f %.2f">' % (int(round(tilesize*h/w)),tilesize,b[0],b[1],w,h))
+
+    def write_tiles(self,dirname,maxzoom=None, #default is the tiles of svg_class
+                    workers=None, #number of processes, default is the number of cpus; 0 writes in this process
+                    tilesize=256, #width of a tile in pixels
+                    thin=32): #at zooms below maxzoom, at most one point of scatter or windbarb_field in thin x thin cells of a tile
+        if self.tiles is None: raise ValueError("write_tiles requires svg_class(tiles=maxzoom)")
+        self.close()
+        if maxzoom is None: maxzoom=self.tiles
+        self.tilestructure=[n for n,q in enumerate(self.tileitems) if q[0] is None]
+        x0,y0,x1,y1=self.tilerect()
+        tail=self.tail()
+        jobs=[]
+        for z in range(maxzoom+1):
+            m=2**z
+            w,h=(x1-x0)/m,(y1-y0)/m
+            for i in range(m):
+                for j in range(m):
+                    b=(x0+i*w,y0+j*h,x0+(i+1)*w,y0+(j+1)*h)
+                    c=self.tileindices(b,thin if z<maxzoom else 0)
+                    if len(c)>len(self.tilestructure): #not empty
+                        jobs.append((os.path.join(dirname,str(z),str(i),"%d.svg" % j),self.tileheader(b,tilesize),c,tail))
+        texts=[q[1] for q in self.tileitems]
+        if workers==0:
+            for job in jobs: writetile(job,texts)
+        else:
+            import concurrent.futures
+            if workers is None: workers=os.cpu_count() or 1
+            with concurrent.futures.ProcessPoolExecutor(workers,initializer=settiletexts,initargs=(texts,)) as pool:
+                for r in pool.map(writetile,jobs,chunksize=16): pass
+        return [job[0] for job in jobs]
 
 #SIMPLE DRAWING
 
+    @primitive
     def rect(self,x,y,width,height,**k): #better than native: negative width and height okay
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
+        style=self.stylestr(k)
         d=self.pathdata('M',x,y,'l',width,0,'l',0,height,'l',-width,0,'Z')
         self.path(d=d,style=style)
 
+    @primitive
     def rect2(self,x1,y1,x2,y2,**k):
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
+        style=self.stylestr(k)
         d=self.pathdata('M',x1,y1,'L',x2,y1,'L',x2,y2,'L',x1,y2,'Z')
         self.path(d=d,style=style)
 
+    @primitive
     def poly(self,*a,**k):
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
-        b=[x for x in flattn(a)]
-        d=self.pathdata('M',b[0:2],'L',b[2:],'Z')
-        self.path(d=d,style=style)
+        simplify=k.pop('simplify',None)
+        a=self.xyargs(a,k.pop('x',None),k.pop('y',None))
+        style=self.stylestr(k)
+        b=self.xyarray(a) #N x 2 array, if numpy arrays were passed
+        if self.cliprect is not None and not self.cullskip and numpy is not None:
+            if b is None: p=numpy.array(self.ptflat([x for x in flattn(a)])).reshape(-1,2)
+            else: p=self.ptarray(b)
+            pieces=[q for q in [clippolygon(p,self.cliprect)] if len(q)]
+            if simplify: pieces=[simplified(q,simplify) for q in pieces]
+            if pieces: self.path(d=self.ptpath(pieces,True),style=style)
+            return
+        if b is None:
+            b=[x for x in flattn(a)]
+            self.path('M',b[0:2],'L',b[2:],'Z',style=style,simplify=simplify)
+        else:
+            self.path('M',b[:1],'L',b[1:],'Z',style=style,simplify=simplify)
 
+    @primitive
     def draw(self,*a,**k):
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
-        b=[x for x in flattn(a)]
-        d=self.pathdata('M',b[0:2],'L',b[2:])
-        self.path(d=d,style=style)
+        simplify=k.pop('simplify',None)
+        a=self.xyargs(a,k.pop('x',None),k.pop('y',None))
+        style=self.stylestr(k)
+        b=self.xyarray(a) #N x 2 array, if numpy arrays were passed
+        if self.cliprect is not None and not self.cullskip and numpy is not None:
+            if b is None: p=numpy.array(self.ptflat([x for x in flattn(a)])).reshape(-1,2)
+            else: p=self.ptarray(b)
+            pieces=clippolyline(p,self.cliprect)
+            if simplify: pieces=[simplified(q,simplify) for q in pieces]
+            if pieces: self.path(d=self.ptpath(pieces,False),style=style)
+            return
+        if b is None:
+            b=[x for x in flattn(a)]
+            self.path('M',b[0:2],'L',b[2:],style=style,simplify=simplify)
+        else:
+            self.path('M',b[:1],'L',b[1:],style=style,simplify=simplify)
 
+    @primitive
     def circle(self,cx,cy,r,**k):
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
-        p='<circle cx="%.2f" cy="%.2f" r="%.2f" ' % (self.ix(cx),self.jy(cy),self.sx(r))
-        if style: p+='style="'+style+'" '
+        style=self.stylestr(k)
+        i,j,r=self.ix(cx),self.jy(cy),self.sx(r)
+        if self.cliprect is not None and not self.cullskip:
+            x0,y0,x1,y1=self.cliprect
+            if i+abs(r)<x0 or i-abs(r)>x1 or j+abs(r)<y0 or j-abs(r)>y1: return
+        if self.compact: p='<circle cx="%s" cy="%s" r="%s" ' % (self.num(i),self.num(j),self.num(r))
+        else: p='<circle cx="%.2f" cy="%.2f" r="%.2f" ' % (i,j,r)
+        if style: p+=self.styleattr(style)
         self.svg.write(p+'/>\n')
 
+    @primitive
     def line(self,x1,y1,x2,y2,**k):
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
-        p='<line x1="%.2f" y1="%.2f" x2="%.2f" y2="%.2f" ' % (self.ix(x1),self.jy(y1),self.ix(x2),self.jy(y2))
-        if style: p+='style="'+style+'" '
+        style=self.stylestr(k)
+        q=(self.ix(x1),self.jy(y1),self.ix(x2),self.jy(y2))
+        if self.cliprect is not None and not self.cullskip:
+            q=clipline(q,self.cliprect)
+            if q is None: return
+        if self.compact: p='<line x1="%s" y1="%s" x2="%s" y2="%s" ' % tuple([self.num(v) for v in q])
+        else: p='<line x1="%.2f" y1="%.2f" x2="%.2f" y2="%.2f" ' % q
+        if style: p+=self.styleattr(style)
         self.svg.write(p+'/>\n')
 
-    def text(self,x,y,angle,text,**k):
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
-        p='<text transform="translate(%8.2f,%8.2f) rotate(%8.2f) "' % (self.ix(x),self.jy(y),-angle)
-        if style: p+=' style="'+style+'" '
+    @primitive
+    def text(self,x,y,angle,text,**k): #returns False if the text was dropped by declutter
+        declutter=k.pop('declutter',self.declutter) #declutter=False places this text regardless
+        i,j=self.ix(x),self.jy(y)
+        if self.tiles is not None: #the label may extend its length in any direction
+            h=fontsize(k)
+            self.tilearound(i,j,labelwidth*h*len(text)+h)
+        if declutter:
+            q=self.placelabel(i,j,angle,text,k)
+            if q is None: return False
+            i,j=q
+        style=self.stylestr(k)
+        if self.compact:
+            p='<text transform="translate(%s,%s) rotate(%s)"' % (self.num(i),self.num(j),self.num(-angle))
+            if style: p+=' '+self.styleattr(style)[:-1]
+            self.svg.write(p+'>'+text+'</text>\n')
+            return True
+        p='<text transform="translate(%8.2f,%8.2f) rotate(%8.2f) "' % (i,j,-angle)
+        if style: p+=' '+self.styleattr(style)
         p+='>\n'
         p+=text+'\n'
         p+='</text>\n'
         self.svg.write(p)
+        return True
+
+#Label placement: with svg_class(declutter=True), text estimates the box of each label in pts from its font size,
+#text_anchor and angle, and tries it at labeloffsets until it overlaps none of the boxes placed before.
+#Labels that cannot be placed are dropped, so the first drawn have priority.  The boxes are kept in a
+#uniform grid of labelcell pts, so the cost of a label does not grow with the number of labels.
+    def placelabel(self,i,j,angle,text,k): #the position of text at i,j in pts, moved to where it fits, or None
+        h=fontsize(k)
+        w=labelwidth*h*len(text)
+        x0={'middle':-.5*w,'end':-w}.get(k.get('text_anchor'),0.)
+        c,s=cos(radians(angle)),sin(radians(angle)) #counterclockwise on the page
+        x=[x0*c+q*s for q in (-.8*h,.2*h)]+[(x0+w)*c+q*s for q in (-.8*h,.2*h)]
+        y=[-x0*s+q*c for q in (-.8*h,.2*h)]+[-(x0+w)*s+q*c for q in (-.8*h,.2*h)]
+        bx0,by0,bx1,by1=min(x)-labelpad,min(y)-labelpad,max(x)+labelpad,max(y)+labelpad
+        for dx,dy in labeloffsets:
+            u,v=i+dx*h,j+dy*h
+            b=(u+bx0,v+by0,u+bx1,v+by1)
+            if b[0]<0 or b[1]<0 or b[2]>self.bbx or b[3]>self.bby: continue
+            if self.labelfree(b):
+                for m in range(int(b[0]//labelcell),int(b[2]//labelcell)+1):
+                    for n in range(int(b[1]//labelcell),int(b[3]//labelcell)+1):
+                        self.labels.setdefault((m,n),[]).append(b)
+                return u,v
+        return None
+
+    def labelfree(self,b): #True if the box b in pts overlaps none of the placed labels
+        labels=self.labels
+        for m in range(int(b[0]//labelcell),int(b[2]//labelcell)+1):
+            for n in range(int(b[1]//labelcell),int(b[3]//labelcell)+1):
+                for e in labels.get((m,n),()):
+                    if e[0]<b[2] and b[0]<e[2] and e[1]<b[3] and b[1]<e[3]: return False
+        return True
 
 #sector with center at user (x,y), but radius r1 and r2 are in pts:
+    @primitive
     def sector(self,x,y,r1,r2,a1,a2,**k):
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
+        style=self.stylestr(k)
         largecircle='0'
         if (a2<a1): a2,a1=a1,a2
         if abs(a2-a1)>180: largecircle='1'
@@ -260,25 +1245,31 @@ self.leftmarg, self.topmarg, self.bbx-self.leftmarg-self.rightmarg, self.bby-sel
         y21=r2*sin(a1)
         y12=r1*sin(a2)
         y22=r2*sin(a2)
+        if self.tiles is not None: self.tilearound(self.ix(x),self.jy(y),max(abs(r1),abs(r2)))
+        self.tileskip+=1 #arcs are in pts, relative to x,y
         d=self.pathdata('M',x,y,'m',hires(x21),hires(-y21),'a',hires(r2),hires(r2),'0',largecircle+',0',hires(x22-x21),hires(-y22+y21),\
 'l',hires(x12-x22),hires(-y12+y22),'a',hires(r1),hires(r1),'0',largecircle+',1',hires(x11-x12),hires(-y11+y12),'Z')
+        self.tileskip-=1
         self.path(d=d,style=style)
 
+    @primitive
     def radial(self,x,y,r1,r2,a1,**k):
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
+        style=self.stylestr(k)
         largecircle='0'
         a1=pi*a1/180.
         x11=r1*cos(a1)
         x21=r2*cos(a1)
         y11=r1*sin(a1)
         y21=r2*sin(a1)
+        if self.tiles is not None: self.tilearound(self.ix(x),self.jy(y),max(abs(r1),abs(r2)))
+        self.tileskip+=1 #arcs are in pts, relative to x,y
         d=self.pathdata('M',x,y,'m',hires(x21),hires(-y21),'l',hires(x11-x21),hires(-y11+y21))
+        self.tileskip-=1
         self.path(d=d,style=style)
 
+    @primitive
     def arc(self,x,y,r,a1,a2,**k):
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
+        style=self.stylestr(k)
         largecircle='0'
         if (a2<a1): a2,a1=a1,a2
         if abs(a2-a1)>180: largecircle='1'
@@ -288,22 +1279,25 @@ self.leftmarg, self.topmarg, self.bbx-self.leftmarg-self.rightmarg, self.bby-sel
         x22=r*cos(a2)
         y21=r*sin(a1)
         y22=r*sin(a2)
+        if self.tiles is not None: self.tilearound(self.ix(x),self.jy(y),abs(r))
+        self.tileskip+=1 #arcs are in pts, relative to x,y
         d=self.pathdata('M',x,y,'m',hires(x21),hires(-y21),'a',hires(r),hires(r),'0',largecircle+',0',hires(x22-x21),hires(-y22+y21))
+        self.tileskip-=1
         self.path(d=d,style=style)
 
 #COMPOSITE DRAWING
+    @primitive
     def square(self,x,y,size,**k): #analog to circle, useful for plot symbol
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
+        style=self.stylestr(k)
         self.group(style=style)
         i,j=hires(self.ix(x)),hires(self.jy(y))
         l=size*100
         self.rect2(i-l,j-l,i+l,j+l,style=style)
         self.group()
 
+    @primitive
     def arrow(self,x1,y1,x2,y2,headsize,**k): #headsize is in pts
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
+        style=self.stylestr(k)
         self.group(style=style)
         i1,j1,i2,j2=self.ix(x1),self.jy(y1),self.ix(x2),self.jy(y2)
         headsize=self.sx(headsize)
@@ -321,9 +1315,9 @@ self.leftmarg, self.topmarg, self.bbx-self.leftmarg-self.rightmarg, self.bby-sel
         'L',hires(i2+headsize*bi),hires(j2+headsize*bj),'Z',stroke='none')
         self.group()
 
+    @primitive
     def fatarrow(self,x1,y1,x2,y2,asize,**k): #asize is the half-width of the fat arrow
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
+        style=self.stylestr(k)
         i1,j1,i2,j2=self.ix(x1),self.jy(y1),self.ix(x2),self.jy(y2)
         asize=self.sx(asize)
         r=sqrt((i2-i1)**2+(j2-j1)**2)
@@ -333,13 +1327,26 @@ self.leftmarg, self.topmarg, self.bbx-self.leftmarg-self.rightmarg, self.bby-sel
         i2+v-u,j2-u-v, i2,j2, i2-v-u,j2+u-v, i1-v,j1+u]]
         self.poly(polypoints,style=style)
 
+    @primitive
     def windbarb(self,x,y,s,a,h,**k):
-        style=k.pop('style',"")
-        for key in k.keys(): style+=key.replace('_','-')+':'+str(k[key])+';'
-        transform= "translate(%8.2f,%8.2f) rotate(%8.2f) " % (self.ix(x),self.jy(y),a-90)
+        style=self.stylestr(k)
+        i,j=self.ix(x),self.jy(y)
+        if self.cliprect is not None and not self.cullskip and self.culled(i,j,h): return
+        if self.tiles is not None: self.tilearound(i,j,h)
+        transform= "translate(%8.2f,%8.2f) rotate(%8.2f) " % (i,j,a-90)
         self.group(style=style,transform=transform)
-        i1,j1=self.ix(x),self.jy(y)
-        a=0.
+        self.tileskip+=1 #the glyph is in pts from the origin
+        self.cullskip+=1
+        self.barbglyph(s,h)
+        self.cullskip-=1
+        self.tileskip-=1
+        self.group()
+
+    def culled(self,i,j,h): #True if the glyph of size h pts around i,j pts is entirely outside of cliprect
+        x0,y0,x1,y1=self.cliprect
+        return i+h<x0 or i-h>x1 or j+h<y0 or j-h>y1
+
+    def barbglyph(self,s,h): #the barb for speed s and size h in pts, pointing along -x from the origin in pts
         i1=0.
         j1=0.
         d=.13*h
@@ -369,15 +1376,220 @@ self.leftmarg, self.topmarg, self.bbx-self.leftmarg-self.rightmarg, self.bby-sel
             self.draw([hires(z) for z in p])
             s=s-5.
             w=w+d
-        self.group()
+
+    @primitive
     def image(self,x,y,file,**k):
         p='<image x="%.2f" y="%.2f" xlink:href="%s" ' % (self.ix(x),self.jy(y),file)
+        if self.tiles is not None:
+            try:
+                self.tilespan(self.ix(x),self.jy(y),self.ix(x)+float(k.get('width',0)),self.jy(y)+float(k.get('height',0)))
+            except ValueError: #width or height with units
+                self.tilespan(0.,0.,float(self.bbx),float(self.bby))
         for key in k.keys(): p+=key.replace('_','-')+'="'+str(k[key])+'" '
         self.svg.write(p+'/>\n')
 
+#BULK DRAWING
+#Plot symbols are defined once in <defs> and then placed with <use>, which is much more compact
+#than a full element for every point.  x and y may be lists or numpy arrays.
+    def marker(self,marker='circle',size=3): #returns id of the marker symbol, defining it if needed; size is in pts
+        r=self.sx(size)
+        key=(marker,"%.2f" % r)
+        if key in self.markers: return self.markers[key]
+        mid="mk%d" % self.markercount
+        self.markercount+=1
+        if marker=='circle':
+            p='<circle id="%s" cx="0" cy="0" r="%.2f"/>' % (mid,r)
+        elif marker in markershapes:
+            d=" ".join(["%.2f %.2f" % (r*u,r*v) for u,v in markershapes[marker]])
+            p='<path id="%s" d="M %s Z"/>' % (mid,d)
+        else:
+            raise ValueError("unknown marker: "+str(marker))
+        self.svg.write('<defs>'+p+'</defs>\n')
+        self.markers[key]=mid
+        return mid
+
+    @primitive
+    def scatter(self,x,y,marker='circle',size=3,**k): #plot symbol at each user (x,y), size is in pts
+        style=self.stylestr(k)
+        mid=self.marker(marker,size)
+        if numpy is not None and (isinstance(x,numpy.ndarray) or isinstance(y,numpy.ndarray)):
+            v=self.ptarray(numpy.column_stack((x,y))).ravel().tolist()
+        else:
+            v=self.ptflat([q for q in flattn(list(zip(x,y)))])
+        if style: self.group(style=style)
+        u='<use xlink:href="#'+mid+'" x="%.2f" y="%.2f"/>\n'
+        n=20000 #points written per chunk
+        for m in range(0,len(v),2*n):
+            c=v[m:m+2*n]
+            if self.compact:
+                c=compactnums(numpy.rint(numpy.array(c)*10**self.precision).astype(numpy.int64),self.precision,False).split(' ')
+                u='<use xlink:href="#'+mid+'" x="%s" y="%s"/>\n'
+            if self.tiles is None: self.svg.write((u*(len(c)//2)) % tuple(c))
+            else: self.tilepoints((u*(len(c)//2)) % tuple(c),v[m:m+2*n:2],v[m+1:m+2*n:2],size)
+        if style: self.group()
+
+
+    @primitive
+    def windbarb_field(self,x,y,s,a,h,**k): #windbarbs at arrays of user x,y with speeds s and directions a, h is size in pts
+        style=self.stylestr(k)
+        usenumpy=numpy is not None
+        if usenumpy:
+            v=self.ptarray(numpy.column_stack((x,y)).astype(float))
+            b=numpy.floor((numpy.asarray(s,dtype=float)+2.5)/5.).astype(int) #speeds quantized to 5 knots
+            r=(numpy.asarray(a,dtype=float)-90.).tolist()
+            i,j=v[:,0].tolist(),v[:,1].tolist()
+            b=b.tolist()
+        else:
+            i=[self.ix(float(q)) for q in x]
+            j=[self.jy(float(q)) for q in y]
+            b=[int(floor((q+2.5)/5.)) for q in s]
+            r=[q-90. for q in a]
+        if self.cliprect is not None and not self.cullskip: #only the barbs reaching into the plot area
+            kept=[n for n in range(len(b)) if not self.culled(i[n],j[n],h)]
+            i,j,b,r=[i[n] for n in kept],[j[n] for n in kept],[b[n] for n in kept],[r[n] for n in kept]
+        bins=sorted(set(b))
+        ids={}
+        for n in bins: #each distinct barb is defined only once
+            key=('windbarb',n,"%.2f" % h)
+            if key not in self.markers:
+                self.markers[key]="mk%d" % self.markercount
+                self.markercount+=1
+                self.svg.write('<defs><g id="%s">\n' % self.markers[key])
+                self.tileskip+=1
+                self.cullskip+=1
+                self.barbglyph(5.*n,h)
+                self.cullskip-=1
+                self.tileskip-=1
+                self.svg.write('</g></defs>\n')
+            ids[n]=self.markers[key]
+        if style: self.group(style=style)
+        u='<use xlink:href="#%s" transform="translate(%8.2f,%8.2f) rotate(%8.2f) "/>\n'
+        n=20000 #barbs written per chunk
+        for m in range(0,len(b),n):
+            t="".join([u % (ids[q],p1,p2,p3) for q,p1,p2,p3 in zip(b[m:m+n],i[m:m+n],j[m:m+n],r[m:m+n])])
+            if self.tiles is None: self.svg.write(t)
+            else: self.tilepoints(t,i[m:m+n],j[m:m+n],h)
+        if style: self.group()
+
+#FIELDS
+#For pcolor, x and y are the edges of the cells, in user coordinates, and values[j,i] is for the cell x[i]..x[i+1],
+#y[j]..y[j+1].  For contour and contourf, field[j,i] is at the point x[i],y[j].  nan values are not drawn.
+#These require numpy.
+    @primitive
+    def pcolor(self,x,y,values,colormap=None, #list of colors, as taken by rgbstring, default rainbow
+                    vmin=None,vmax=None, #values mapped to the first and last color, default their range
+                    png=None,**k): #embed an image rather than paths; default for over pcolor_threshold cells on a regular grid
+        if numpy is None: raise ImportError("pcolor requires numpy")
+        if colormap is None: colormap=rainbow
+        values=numpy.asarray(values,dtype=float)
+        ny,nx=values.shape
+        i=self.ptarray(numpy.column_stack((numpy.asarray(x,dtype=float),numpy.zeros(nx+1))))[:,0] #edges in pts
+        j=self.ptarray(numpy.column_stack((numpy.zeros(ny+1),numpy.asarray(y,dtype=float))))[:,1]
+        c=colorindex(values,len(colormap),vmin,vmax)
+        regular=evenspaced(i) and evenspaced(j)
+        if png is None: png=regular and values.size>pcolor_threshold
+        if png and not regular: raise ValueError("pcolor with png requires evenly spaced x and y")
+        style=self.stylestr(k)
+        if style: self.group(style=style)
+        if png:
+            rgba=numpy.zeros((ny,nx,4),dtype=numpy.uint8)
+            rgba[:,:,:3]=colortable(colormap)[c]
+            rgba[:,:,3]=numpy.where(c>=0,255,0)
+            if i[-1]<i[0]: rgba=rgba[:,::-1]
+            if j[-1]<j[0]: rgba=rgba[::-1] #the first row of the image is at the top
+            self.image(hires(min(i[0],i[-1])),hires(min(j[0],j[-1])),
+                    "data:image/png;base64,"+base64.b64encode(pngbytes(rgba)).decode('ascii'),
+                    width=self.num(abs(i[-1]-i[0])),height=self.num(abs(j[-1]-j[0])),
+                    preserveAspectRatio="none",style="image-rendering:pixelated")
+        else: #runs of cells of the same color in each row, one path for each color
+            start=numpy.ones((ny,nx),dtype=bool)
+            start[:,1:]=c[:,1:]!=c[:,:-1]
+            f=numpy.flatnonzero(start) #flat index of the first cell of each run
+            e=numpy.append(f[1:],ny*nx) #the next run starts in the same row, or at the beginning of the next
+            row=f//nx
+            color=c.ravel()[f]
+            q=numpy.column_stack((i[f-row*nx],j[row],i[e-row*nx],j[row+1]))
+            order=numpy.argsort(color,kind='stable')
+            color,q=color[order],q[order]
+            for n in numpy.unique(color).tolist():
+                if n<0: continue
+                r=q[numpy.searchsorted(color,n):numpy.searchsorted(color,n,'right')]
+                fill=colormap[n]
+                if not isinstance(fill,str): fill=rgbstring(fill)
+                self.path(d=self.cellpath(r),fill=fill,stroke='none')
+        if style: self.group()
+
+    @primitive
+    def contour(self,x,y,field,levels=10, #list of levels, or the number of levels evenly spaced within the range of field
+                    colormap=None, #stroke colors of the levels, default is the stroke of the group
+                    labels=False, #label each isoline longer than labellen pts with its level
+                    form='%g',labellen=150,**k):
+        if numpy is None: raise ImportError("contour requires numpy")
+        field=numpy.asarray(field,dtype=float)
+        x,y=numpy.asarray(x,dtype=float),numpy.asarray(y,dtype=float)
+        levels=contourlevels(field,levels,False)
+        style=self.stylestr(k)
+        self.group(style=style,fill='none')
+        for n,level in enumerate(levels):
+            lines=isolines(x,y,field,level)
+            if not lines: continue
+            a=[]
+            for p in lines: a+=['M',p[:1],'L',p[1:]]
+            if colormap is None: self.path(*a)
+            else:
+                c=colormap[int(n*len(colormap)/len(levels))]
+                self.path(*a,stroke=c if isinstance(c,str) else rgbstring(c))
+            if labels:
+                for p in lines: self.contourlabel(self.ptarray(p),form % level,labellen)
+        self.group()
+
+    @primitive
+    def contourf(self,x,y,field,levels=10, #list of levels, or the number of bands evenly spaced over the range of field
+                    colormap=None,**k): #fill colors of the bands between levels, default rainbow
+        if numpy is None: raise ImportError("contourf requires numpy")
+        if colormap is None: colormap=rainbow
+        field=numpy.asarray(field,dtype=float)
+        x,y=numpy.asarray(x,dtype=float),numpy.asarray(y,dtype=float)
+        levels=contourlevels(field,levels,True)
+        low=numpy.nanmin(field)-1. if numpy.isfinite(field).any() else 0.
+        f=numpy.full((field.shape[0]+2,field.shape[1]+2),low) #a low border, so that every region is closed
+        f[1:-1,1:-1]=numpy.where(numpy.isfinite(field),field,low) #nan regions are holes
+        x=numpy.concatenate((x[:1],x,x[-1:]))
+        y=numpy.concatenate((y[:1],y,y[-1:]))
+        style=self.stylestr(k)
+        self.group(style=style,stroke='none',fill_rule='evenodd')
+        for n in range(len(levels)-1): #painted over by the following bands; values above the last level are in the last band
+            lines=isolines(x,y,f,levels[n])
+            if not lines: continue
+            a=[]
+            for p in lines: a+=['M',p[:1],'L',p[1:],'Z']
+            c=colormap[int(n*len(colormap)/(len(levels)-1))]
+            self.path(*a,fill=c if isinstance(c,str) else rgbstring(c))
+        self.group()
+
+    def contourlabel(self,p,text,labellen): #text at the middle of the polyline p in pts, if it is long enough
+        d=numpy.hypot(numpy.diff(p[:,0]),numpy.diff(p[:,1]))
+        if d.sum()<labellen: return
+        m=min(numpy.searchsorted(numpy.cumsum(d),.5*d.sum()),len(d)-1)
+        angle=degrees(atan2(p[m,1]-p[m+1,1],p[m+1,0]-p[m,0]))
+        if angle>90: angle-=180
+        elif angle<=-90: angle+=180
+        self.text(hires(.5*(p[m,0]+p[m+1,0])),hires(.5*(p[m,1]+p[m+1,1])),angle,text,text_anchor='middle',fill='black',stroke='none')
+
+    @timed('format')
+    def cellpath(self,q): #pathdata of rectangles, rows of q are x0,y0,x1,y1 in pts
+        if self.compact:
+            Q=numpy.rint(q*10**self.precision).astype(numpy.int64)
+            w,h=Q[:,2]-Q[:,0],Q[:,3]-Q[:,1]
+            v=compactnums(numpy.column_stack((Q[:,0],Q[:,1],w,h,-w)).ravel(),self.precision,False).split(' ')
+            return ("M%s %sh%sv%sh%sz"*len(q)) % tuple(v)
+        v=q[:,[0,1,2,3,0]].ravel().tolist()
+        return (" M %.2f %.2f H %.2f V %.2f H %.2f Z"*len(q)) % tuple(v)
+
 #AXES DRAWING
 #If you don't use the defaults, you should call these using your user coordinates only,
 #except for ticklen and pad, which can be passed as an integer
+    @primitive
     def xaxis(self, y="", #where to intersect the y-axis
                     x1="", #smallest x
                     dx="", #increment for tick marks
@@ -411,6 +1623,7 @@ self.leftmarg, self.topmarg, self.bbx-self.leftmarg-self.rightmarg, self.bby-sel
             self.path('M',x,y,'l',0,-ticklen)
             if form: self.text(x,y-1.5*pad/self.yscale,0,str,stroke_width=".3pt",text_anchor='middle')
 
+    @primitive
     def yaxis(self, x="", #where to intersect the x-axis
                     y1="", #smallest y
                     dy="", #increment for tick marks
@@ -446,12 +1659,12 @@ self.leftmarg, self.topmarg, self.bbx-self.leftmarg-self.rightmarg, self.bby-sel
 
 ### some functions independent of svg_class
 
-if pyvers<3: #long integers are hi-res svg coordinates
-    def hires(x): #converts svg (pts) coordinates to hi-res coordinate type
-        return long(100*x)
-else: #Python version 3.0 no longer supports long integers
-    def hires(x): #converts svg (pts) coordinates to hi-res coordinate type
-        return(fractions.Fraction(int(x*100),100))
+#long integers (*100) on Python 2, and Fractions, are still accepted as hi-res svg coordinates
+def hires(x): #converts svg (pts) coordinates to hi-res coordinate type
+    return svg_pt(int(x*100))
+
+def hiresarray(a): #converts an array of svg (pts) coordinates, as for hires, to an svg_ptarray
+    return (numpy.trunc(numpy.asarray(a,dtype=float)*100)/100).view(svg_ptarray)
 
 #following is from
 # http://www.ubookcase.com/book/Oreilly/Python.Cookbook.2nd.edition/0596007973/pythoncook2-chp-4-sect-6.html
@@ -468,6 +1681,345 @@ def flattn(sequence, to_expand=list_or_tuple):
             yield item
 #-----
 
+parallel_threshold=200000 #coordinate pairs in a path above which svg_class(workers=n) formats in parallel
+parallel_chunk=50000 #coordinate pairs formatted by a worker at a time
+
+def fmtpairs(v): #formatted coordinate pairs of a flat list of pts, or of an N x 2 numpy array of pts
+    if not isinstance(v,list): v=v.ravel().tolist()
+    n=len(v)//2
+#       return ", ".join([" %.2f %.2f"]*n) % tuple(v[:2*n]) #separate coordinate pairs by commas
+    return " ".join([" %.2f %.2f"]*n) % tuple(v[:2*n]) #no comma works in more browsers and software
+
+#Compact encoding, see svg_class(compact=True)
+pathcommands=set('MmZzLlHhVvCcSsQqTtAa')
+trailingzeros=re.compile(r'(\.\d*?)0+(?= |$)')
+trailingdot=re.compile(r'\.(?= |$)')
+leadingzero=re.compile(r'(^| |-)0\.')
+
+def compactnums(q,precision,joined=True): #numbers of integer array q, in units of 10**-precision, trimmed
+    if precision==0: s=" ".join(map(str,q.tolist()))
+    elif precision<=4: #repr of q/10**precision is the shortest decimal, no exponent for these precisions
+        s=(" "+" ".join(map(repr,(q/float(10**precision)).tolist()))+" ").replace(".0 "," ")
+        s=s.replace(" 0."," .").replace(" -0."," -.")[1:-1]
+    else:
+        v=(q/float(10**precision)).tolist()
+        s=" ".join(["%."+str(precision)+"f"]*len(v)) % tuple(v)
+        s=leadingzero.sub(r'\1.',trailingdot.sub('',trailingzeros.sub(r'\1',s)))
+    if joined: s=s.replace(' -','-') #the minus sign separates numbers
+    return s
+
+def compactnum(v,precision): #single number, trimmed
+    s="%.*f" % (precision,v)
+    if '.' in s: s=s.rstrip('0').rstrip('.')
+    if s.startswith('0.'): s=s[1:]
+    elif s.startswith('-0.'): s='-'+s[2:]
+    if s=='-0': s='0'
+    return s
+
+def fixedlen(p): #length of the coordinate pairs of the N x 2 array of pts p, in the default encoding
+    a=numpy.abs(p)
+    n=numpy.floor(numpy.log10(numpy.maximum(a+.005,1.)))+4+(p<=-.005)
+    return int(n.sum())+3*len(p)-1
+
+#Culling and clipping to the rectangle r=(x0,y0,x1,y1) in pts, see scale(cull=True)
+def outcode(x,y,r):
+    c=0
+    if x<r[0]: c|=1
+    elif x>r[2]: c|=2
+    if y<r[1]: c|=4
+    elif y>r[3]: c|=8
+    return c
+
+def clipline(q,r): #Cohen-Sutherland, q=(x1,y1,x2,y2), returns clipped q or None if entirely outside
+    x1,y1,x2,y2=q
+    c1,c2=outcode(x1,y1,r),outcode(x2,y2,r)
+    while True:
+        if not (c1|c2): return (x1,y1,x2,y2)
+        if c1&c2: return None
+        c=c1 or c2
+        if c&8: x,y=x1+(x2-x1)*(r[3]-y1)/(y2-y1),r[3]
+        elif c&4: x,y=x1+(x2-x1)*(r[1]-y1)/(y2-y1),r[1]
+        elif c&2: x,y=r[2],y1+(y2-y1)*(r[2]-x1)/(x2-x1)
+        else: x,y=r[0],y1+(y2-y1)*(r[0]-x1)/(x2-x1)
+        if c==c1:
+            x1,y1=x,y
+            c1=outcode(x1,y1,r)
+        else:
+            x2,y2=x,y
+            c2=outcode(x2,y2,r)
+
+def clippolyline(p,r): #Liang-Barsky on all segments of the N x 2 array p at once, returns list of pieces
+    if len(p)<2: return []
+    a,b=p[:-1],p[1:]
+    d=b-a
+    t0=numpy.zeros(len(d))
+    t1=numpy.ones(len(d))
+    with numpy.errstate(divide='ignore',invalid='ignore'):
+        for pp,qq in ((-d[:,0],a[:,0]-r[0]),(d[:,0],r[2]-a[:,0]),(-d[:,1],a[:,1]-r[1]),(d[:,1],r[3]-a[:,1])):
+            t=qq/pp
+            t0=numpy.where(pp<0,numpy.maximum(t0,t),t0)
+            t1=numpy.where(pp>0,numpy.minimum(t1,t),t1)
+            t1=numpy.where((pp==0)&(qq<0),-1.,t1) #parallel to and outside of this edge
+    vis=t0<t1 #segments touching the rectangle at a single point are not visible
+    if not vis.any(): return []
+    s=a+t0[:,None]*d
+    s[t0==0]=a[t0==0] #unclipped points are kept exactly
+    e=a+t1[:,None]*d
+    e[t1==1]=b[t1==1]
+    new=vis.copy() #visible segments that start a new piece
+    new[1:]&=~(vis[:-1]&(t1[:-1]==1)&(t0[1:]==0))
+    k=numpy.nonzero(vis)[0]
+    pieces=[]
+    starts=numpy.nonzero(new[k])[0].tolist()+[len(k)]
+    for m in range(len(starts)-1):
+        g=k[starts[m]:starts[m+1]]
+        pieces.append(numpy.concatenate((s[g[:1]],e[g])))
+    return pieces
+
+def clippolygon(p,r): #Sutherland-Hodgman, one edge of r at a time on all vertices of the N x 2 array p
+    for axis,bound,keep in ((0,r[0],1),(0,r[2],-1),(1,r[1],1),(1,r[3],-1)):
+        if len(p)==0: break
+        q=numpy.roll(p,1,axis=0) #previous vertex
+        inp=(p[:,axis]-bound)*keep>=0
+        inq=(q[:,axis]-bound)*keep>=0
+        with numpy.errstate(divide='ignore',invalid='ignore'):
+            t=(bound-q[:,axis])/(p[:,axis]-q[:,axis])
+            x=q+t[:,None]*(p-q)
+        x[:,axis]=bound
+        cross=inp!=inq #edge crosses the boundary, the intersection comes before the vertex
+        n=cross.astype(int)+inp
+        out=numpy.empty((int(n.sum()),2))
+        pos=numpy.cumsum(n)-n
+        out[pos[cross]]=x[cross]
+        out[(pos+cross)[inp]]=p[inp]
+        p=out
+    if len(p): p=p[numpy.any(p!=numpy.roll(p,1,axis=0),axis=1)] #repeated vertices
+    return p
+
+def ptpathdata(pieces,closed=False): #pathdata string for polylines given as arrays of pts, as pathdata would make
+    d=[]
+    for p in pieces:
+        v=p.ravel().tolist()
+        n=len(v)//2
+        d.append(" M"+" %.2f %.2f" % tuple(v[:2])+" L"+" ".join([" %.2f %.2f"]*(n-1)) % tuple(v[2:2*n]))
+        if closed: d.append(" Z")
+    return "".join(d)
+
+#Decimation of long polylines, given as N x 2 numpy arrays of pts.  The first and last points are kept.
+#simplify is a mode, or a tuple of (mode,parameter):
+#  'distance' : drop points closer than parameter pts (default .5) to the previously kept point
+#  'dp'       : Douglas-Peucker, with tolerance of parameter pts (default .25)
+#  'lttb'     : largest triangle three buckets, down to parameter points (default 2000)
+def simplified(p,simplify):
+    if numpy is None: raise ImportError("simplify requires numpy")
+    if isinstance(simplify,(list,tuple)): mode,q=simplify
+    else: mode,q=simplify,None
+    if mode=='distance': return mindistance(p,.5 if q is None else q)
+    elif mode=='dp': return douglaspeucker(p,.25 if q is None else q)
+    elif mode=='lttb': return lttb(p,2000 if q is None else int(q))
+    raise ValueError("unknown simplify mode: "+str(mode))
+
+def mindistance(p,tol):
+    if len(p)<3 or tol<=0: return p
+    c=numpy.floor(p/tol) #consecutive points in the same tol x tol cell are dropped first, all at once
+    keep=numpy.ones(len(p),bool)
+    keep[1:]=numpy.any(c[1:]!=c[:-1],axis=1)
+    keep[-1]=True
+    idx=numpy.nonzero(keep)[0].tolist()
+    x,y=p[:,0].tolist(),p[:,1].tolist()
+    kept=[idx[0]]
+    t2=tol*tol
+    for n in idx[1:-1]: #then the remaining points are checked against the last kept point
+        m=kept[-1]
+        if (x[n]-x[m])**2+(y[n]-y[m])**2>=t2: kept.append(n)
+    kept.append(idx[-1])
+    return p[kept]
+
+def douglaspeucker(p,tol):
+    n=len(p)
+    if n<3: return p
+    keep=numpy.zeros(n,bool)
+    keep[0]=keep[-1]=True
+    stack=[(0,n-1)]
+    while stack:
+        i,j=stack.pop()
+        if j<=i+1: continue
+        dx,dy=p[j]-p[i]
+        q=p[i+1:j]-p[i]
+        L=sqrt(dx*dx+dy*dy)
+        if L>0: e=numpy.abs(q[:,0]*dy-q[:,1]*dx)/L #distance from the chord
+        else: e=numpy.hypot(q[:,0],q[:,1])
+        m=int(numpy.argmax(e))
+        if e[m]>tol:
+            m+=i+1
+            keep[m]=True
+            stack.append((i,m))
+            stack.append((m,j))
+    return p[keep]
+
+def lttb(p,npts):
+    n=len(p)
+    if npts>=n or npts<3: return p
+    kept=[0]
+    edges=numpy.linspace(1,n-1,npts-1).astype(int) #buckets between the first and last points
+    a=0
+    for b in range(npts-2):
+        lo,hi=edges[b],edges[b+1]
+        if b+2<npts-1: nxt=p[edges[b+1]:edges[b+2]].mean(axis=0)
+        else: nxt=p[-1]
+        q=p[lo:hi]
+        area=numpy.abs((p[a,0]-nxt[0])*(q[:,1]-p[a,1])-(p[a,0]-q[:,0])*(nxt[1]-p[a,1]))
+        a=lo+int(numpy.argmax(area))
+        kept.append(a)
+    kept.append(n-1)
+    return p[kept]
+
+#Colors of fields, see svg_class.pcolor
+pcolor_threshold=250000 #cells above which pcolor embeds a png, if the grid is regular
+rainbow=[(0,0,255),(0,128,255),(0,255,255),(0,255,128),(0,255,0),(128,255,0),(255,255,0),(255,128,0),(255,0,0)]
+
+def colorindex(v,n,vmin=None,vmax=None): #index into a colormap of n colors for each value of the array v, -1 for nan
+    v=numpy.asarray(v,dtype=float)
+    ok=numpy.isfinite(v)
+    if vmin is None: vmin=v[ok].min() if ok.any() else 0.
+    if vmax is None: vmax=v[ok].max() if ok.any() else 1.
+    f=float(n)/(vmax-vmin) if vmax>vmin else 0.
+    with numpy.errstate(invalid='ignore'):
+        c=numpy.clip(numpy.floor((v-vmin)*f),0,n-1)
+    c[~ok]=-1
+    return c.astype(int)
+
+def colortable(colormap): #N x 3 uint8 array of the colors, as rgbstring would write them
+    t=[]
+    for c in colormap:
+        if isinstance(c,str):
+            m=re.match(r'rgb\((\d+),(\d+),(\d+)\)$',c.replace(' ',''))
+            if m is None: raise ValueError("color %r is not rgb(r,g,b) or a tuple" % c)
+            t.append([int(q) for q in m.groups()])
+        else:
+            t.append([int(q) for q in re.findall(r'\d+',rgbstring(c))])
+    return numpy.array(t,dtype=numpy.uint8)
+
+def evenspaced(p): #True if the coordinates p are evenly spaced, within .01 pts
+    d=numpy.diff(p)
+    return len(d)>0 and bool(numpy.all(numpy.abs(d-d[0])<.01))
+
+def contourlevels(field,levels,bands): #list of levels: given, or evenly spaced over the range of field
+    if list_or_tuple(levels) or isinstance(levels,numpy.ndarray): return sorted([float(q) for q in levels])
+    ok=numpy.isfinite(field)
+    if not ok.any(): return []
+    lo,hi=float(field[ok].min()),float(field[ok].max())
+    if bands: return [lo+(hi-lo)*n/float(levels) for n in range(levels+1)] #from the minimum to the maximum
+    return [lo+(hi-lo)*(n+1)/float(levels+1) for n in range(levels)] #within the range
+
+#Marching squares.  A cell j,i has the corners field[j,i], [j,i+1], [j+1,i+1] and [j+1,i], and edges
+#0 bottom, 1 right, 2 top and 3 left.  An isoline crosses an edge whose ends are on different sides of the level,
+#and the edges crossed in a cell are joined by segments, which are stitched into polylines through the edges.
+def isolines(x,y,field,level): #list of N x 2 arrays of user coordinates of the isolines of field at level
+    ny,nx=field.shape
+    if ny<2 or nx<2: return []
+    ok=numpy.isfinite(field)
+    above=field>=level
+    nh=ny*(nx-1) #horizontal edges, ids 0..nh-1, then vertical edges
+    hcross=(above[:,1:]!=above[:,:-1])&ok[:,1:]&ok[:,:-1]
+    vcross=(above[1:]!=above[:-1])&ok[1:]&ok[:-1]
+    hj,hi=numpy.nonzero(hcross)
+    vj,vi=numpy.nonzero(vcross)
+    if not len(hj) and not len(vj): return []
+    ids=numpy.concatenate((hj*(nx-1)+hi,nh+vj*nx+vi)) #ids of the crossed edges, in increasing order
+    with numpy.errstate(divide='ignore',invalid='ignore'):
+        t=(level-field[hj,hi])/(field[hj,hi+1]-field[hj,hi])
+        u=(level-field[vj,vi])/(field[vj+1,vi]-field[vj,vi])
+    pts=numpy.empty((len(ids),2))
+    pts[:len(hj),0]=x[hi]+t*(x[hi+1]-x[hi])
+    pts[:len(hj),1]=y[hj]
+    pts[len(hj):,0]=x[vi]
+    pts[len(hj):,1]=y[vj]+u*(y[vj+1]-y[vj])
+    cell=ok[:-1,:-1]&ok[:-1,1:]&ok[1:,:-1]&ok[1:,1:]
+    case=(above[:-1,:-1]*1+above[:-1,1:]*2+above[1:,1:]*4+above[1:,:-1]*8)*cell
+    j,i=numpy.nonzero((case!=0)&(case!=15))
+    case=case[j,i]
+    e=numpy.column_stack((j*(nx-1)+i,nh+j*nx+i+1,(j+1)*(nx-1)+i,nh+j*nx+i)) #edge ids of the cells
+    c=numpy.column_stack((hcross[j,i],vcross[j,i+1],hcross[j+1,i],vcross[j,i]))
+    saddle=(case==5)|(case==10)
+    two=~saddle
+    first=numpy.argmax(c[two],axis=1)
+    second=3-numpy.argmax(c[two][:,::-1],axis=1)
+    et=e[two]
+    a=[et[numpy.arange(len(et)),first]]
+    b=[et[numpy.arange(len(et)),second]]
+    if saddle.any(): #the center decides which corners are joined
+        es=e[saddle]
+        js,is_=j[saddle],i[saddle]
+        center=.25*(field[js,is_]+field[js,is_+1]+field[js+1,is_]+field[js+1,is_+1])>=level
+        pair=(case[saddle]==5)==center #segments 0-1 and 2-3, else 3-0 and 1-2
+        a+=[numpy.where(pair,es[:,0],es[:,3]),numpy.where(pair,es[:,2],es[:,1])]
+        b+=[numpy.where(pair,es[:,1],es[:,0]),numpy.where(pair,es[:,3],es[:,2])]
+    a=numpy.searchsorted(ids,numpy.concatenate(a)).tolist() #segments between crossing points
+    b=numpy.searchsorted(ids,numpy.concatenate(b)).tolist()
+    return [pts[q] for q in stitch(a,b,len(ids))]
+
+def stitch(a,b,m): #polylines, as lists of point indices, from the segments a[k]-b[k] among m points
+    n1=[-1]*m #neighbours of each point, there are at most two
+    n2=[-1]*m
+    for p,q in zip(a,b):
+        if n1[p]<0: n1[p]=q
+        else: n2[p]=q
+        if n1[q]<0: n1[q]=p
+        else: n2[q]=p
+    seen=bytearray(m)
+    lines=[]
+    ends=[p for p in range(m) if n2[p]<0]
+    for start in ends+list(range(m)): #open polylines from their ends first, then closed loops
+        if seen[start] or n1[start]<0: continue
+        seen[start]=1
+        line=[start]
+        prev,cur=-1,start
+        while True:
+            nxt=n1[cur] if n1[cur]!=prev else n2[cur]
+            if nxt<0: break
+            if seen[nxt]:
+                if nxt==start and len(line)>2: line.append(start) #closed
+                break
+            seen[nxt]=1
+            line.append(nxt)
+            prev,cur=cur,nxt
+        if len(line)>1: lines.append(line)
+    return lines
+
+def pngbytes(rgba): #png file of the H x W x 4 uint8 array rgba
+    h,w=rgba.shape[:2]
+    raw=numpy.zeros((h,1+4*w),dtype=numpy.uint8) #each row starts with filter type 0
+    raw[:,1:]=rgba.reshape(h,4*w)
+    def chunk(tag,data):
+        return struct.pack('>I',len(data))+tag+data+struct.pack('>I',zlib.crc32(tag+data)&0xffffffff)
+    return (b'\x89PNG\r\n\x1a\n'+chunk(b'IHDR',struct.pack('>IIBBBBB',w,h,8,6,0,0,0))+
+            chunk(b'IDAT',zlib.compress(raw.tobytes(),6))+chunk(b'IEND',b''))
+
+#Label placement, see svg_class.placelabel
+labeloffsets=[(0,0),(0,-1.2),(0,1.2),(.5,0),(-.5,0),(.5,-1.2),(-.5,-1.2),(.5,1.2),(-.5,1.2)] #tried in turn, in units of the font size
+labelwidth=.6 #width of a character, as a fraction of the font size
+labelpad=1. #pts around each label
+labelcell=64. #pts, cell size of the grid of placed labels
+fontunits={'pt':1.25,'px':1.,'pc':15.,'mm':3.543307,'cm':35.43307,'in':90.,'em':12.5} #in pts, the units of svg coordinates
+
+def fontsize(k): #font size in pts from the keyword arguments of text, 10pt if not given
+    f=k.get('font_size')
+    if f is None:
+        m=re.search(r'font-size:([^;]+)',k.get('style',""))
+        if m is None: return 12.5
+        f=m.group(1)
+    if not isinstance(f,str): return float(f)
+    m=re.match(r'\s*([\d.]+)\s*([a-z]*)',f)
+    if m is None: return 12.5
+    return float(m.group(1))*fontunits.get(m.group(2),1.)
+
+markershapes={ #vertices of plot symbols for scatter, in units of the marker size
+    'square':[(-1,-1),(1,-1),(1,1),(-1,1)],
+    'diamond':[(0,-1),(1,0),(0,1),(-1,0)],
+    'triangle':[(0,-1),(.866,.5),(-.866,.5)],
+    }
+
 def rgbstring(*colors):
     if colors:
         f=colors[0]
@@ -488,6 +2040,191 @@ def stylestring(**k):
         s+=key.replace('_','-')+':'+str(k[key])+';'
     return s
 
+#Rendering many independent figures in a pool of processes.
+#Each job is (render,args), (render,args,kwargs) or a dict with those keys and optionally 'fname' and 'svgargs'.
+#render(a,*args,**kwargs) draws into the svg_class a, which is created and closed for it.  render must be
+#picklable, i.e. a function defined at the top level of a module.  Unless given by the job, the file name is
+#fname % index of the job in jobs.  With inmemory, nothing is written to disk and the bytes are returned.
+batch_result=collections.namedtuple('batch_result','fname data error') #error is a traceback string, or None
+
+def jobfname(n,job,fname): #file name of job n of render_batch
+    if isinstance(job,dict): return job.get('fname',fname % n)
+    return fname % n
+
+def renderjob(n,job,fname,svgargs,inmemory): #render one job of render_batch
+    if isinstance(job,dict):
+        render,args,kwargs=job['render'],job.get('args',()),job.get('kwargs',{})
+        svgargs=dict(svgargs,**job.get('svgargs',{}))
+    else:
+        render,args,kwargs=(tuple(job)+({},))[:3]
+    fname=jobfname(n,job,fname)
+    out=io.BytesIO() if inmemory else fname
+    a=None
+    try:
+        a=svg_class(out,**dict({'verbose':False},**svgargs))
+        render(a,*args,**kwargs)
+        a.close()
+    except Exception:
+        if a is not None and not a.svg.closed: a.svg.close()
+        if not inmemory and os.path.exists(fname): os.remove(fname) #no partial files
+        return batch_result(fname,None,traceback.format_exc())
+    if inmemory: return batch_result(fname,out.getvalue(),None)
+    return batch_result(fname,None,None)
+
+def render_batch(jobs,fname="figure%05d.svg",svgargs=None,
+                workers=None, #number of processes, default is the number of cpus; 0 renders in this process
+                inflight=None, #maximum number of submitted jobs not yet finished, default is 4*workers
+                inmemory=False):
+    if svgargs is None: svgargs={}
+    if workers==0:
+        return [renderjob(n,job,fname,svgargs,inmemory) for n,job in enumerate(jobs)]
+    import concurrent.futures
+    if workers is None: workers=os.cpu_count() or 1
+    if inflight is None: inflight=4*workers
+    results=[None]*len(jobs)
+    pending={}
+    def finish(f): #keeps the result of a finished job, or the error if it could not be run or returned
+        n=pending.pop(f)
+        try:
+            results[n]=f.result()
+        except Exception:
+            results[n]=batch_result(jobfname(n,jobs[n],fname),None,traceback.format_exc())
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        for n,job in enumerate(jobs):
+            while len(pending)>=inflight:
+                done,rest=concurrent.futures.wait(pending,return_when=concurrent.futures.FIRST_COMPLETED)
+                for f in done: finish(f)
+            pending[pool.submit(renderjob,n,job,fname,svgargs,inmemory)]=n
+        for f in concurrent.futures.as_completed(list(pending)):
+            finish(f)
+    return results
+
+#Streaming: svg_stream draws a document in a background thread, by render(a,*args,**kwargs) as in render_batch,
+#and passes it on in chunks of bytes as they are written, e.g. for the response of a web server:
+#    for chunk in svg_stream(render,args): send(chunk)
+#    async for chunk in svg_stream(render,args): await send(chunk)
+#The header is passed on when svg_class is made, and the tail when render returns.  At most maxchunks chunks of
+#about bufsize bytes wait for the reader, then drawing waits.  An exception in render is raised by the iterator.
+#If the reader stops early, close() the stream, which ends the drawing.
+class svg_pipe: #writable file object passing chunks of bytes to the reader of an svg_stream
+    mode='wb'
+    def __init__(self,maxchunks):
+        self.q=queue.Queue(maxchunks)
+        self.cancelled=False
+
+    def put(self,item): #waits while the queue is full, unless the reader has gone
+        while not self.cancelled:
+            try:
+                self.q.put(item,timeout=.1)
+                return
+            except queue.Full:
+                pass
+        raise IOError("svg_stream was closed by the reader")
+
+    def write(self,b):
+        self.put(b)
+        return len(b)
+
+    def flush(self):
+        pass
+
+streamend=object() #last item of an svg_pipe
+
+class svg_stream:
+    def __init__(self,render,args=(),kwargs=None,svgargs=None,maxchunks=16,bufsize=16384):
+        self.pipe=svg_pipe(maxchunks)
+        self.done=False
+        self.thread=threading.Thread(target=self.run,args=(render,args,kwargs or {},svgargs or {},bufsize))
+        self.thread.daemon=True
+        self.thread.start()
+
+    def run(self,render,args,kwargs,svgargs,bufsize): #in the background thread
+        a=None
+        try:
+            a=svg_class(self.pipe,**dict({'verbose':False,'bufsize':bufsize},**svgargs))
+            a.svg.flush() #the header, without waiting for the first primitives
+            render(a,*args,**kwargs)
+            a.close()
+            self.pipe.put(streamend)
+        except BaseException as e: #also e.g. KeyboardInterrupt, so that the reader does not wait forever
+            if a is not None and a.pool is not None: a.pool.shutdown()
+            try:
+                self.pipe.put(e)
+            except IOError: #the reader has gone
+                pass
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.nextchunk(StopIteration)
+    next=__next__ #Python 2
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self): #awaitable of the next chunk, which waits in a thread of the event loop
+        import asyncio
+        return asyncio.get_event_loop().run_in_executor(None,self.nextchunk,StopAsyncIteration)
+
+    def nextchunk(self,stop): #waits for the next chunk, unless the stream is closed
+        while True:
+            if self.done or self.pipe.cancelled: raise stop
+            try:
+                item=self.pipe.q.get(timeout=.1)
+                break
+            except queue.Empty:
+                pass
+        if item is streamend or isinstance(item,BaseException): self.done=True
+        if item is streamend: raise stop
+        if isinstance(item,BaseException): raise item
+        return item
+
+    def read(self): #the rest of the document
+        return b"".join(self)
+
+    def close(self): #stop reading, and end the drawing
+        self.pipe.cancelled=True
+        self.done=True
+        self.drain()
+        self.thread.join()
+        self.drain()
+        self.pipe.q.put(streamend) #for a reader still waiting in another thread
+
+    def drain(self):
+        while True:
+            try:
+                self.pipe.q.get_nowait()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+tiletexts=None #texts of the items of the document, in a process writing tiles
+
+def settiletexts(texts):
+    global tiletexts
+    tiletexts=texts
+
+def writetile(job,texts=None): #write one tile of write_tiles
+    fname,header,indices,tail=job
+    if texts is None: texts=tiletexts
+    d=os.path.dirname(fname)
+    if d and not os.path.isdir(d):
+        try:
+            os.makedirs(d)
+        except OSError: #made by another process
+            pass
+    f=open(fname,'w')
+    f.write(header)
+    f.write("".join([texts[n] for n in indices]))
+    f.write(tail)
+    f.close()
+
 def SVGtest():
     import simpleSVG
     sys.stdout.write("A sample plot will be output as testSVG.svg\n")
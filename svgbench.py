@@ -0,0 +1,248 @@
+# svgbench.py is a headless benchmark suite for simpleSVG.py.
+# Each workload renders into memory, and its wall time, peak memory (tracemalloc) and output bytes are recorded.
+# Usage, e.g. in Linux:
+#   python svgbench.py --save baseline.json          # run and store a baseline
+#   python svgbench.py --compare baseline.json       # run and compare with the baseline, exit status 1 on regression
+#   python svgbench.py --only draw --quick           # a subset, with the largest sizes left out
+####
+
+import sys,io,json,time,math,platform,argparse,contextlib,tracemalloc
+import simpleSVG
+try:
+    import numpy
+except ImportError:
+    numpy=None
+
+def newsvg(**k): #svg_class rendering into memory
+    return simpleSVG.svg_class(io.BytesIO(),bbx=800,bby=600,**k)
+
+def series(n): #a wiggly time series of n points, as user coordinates on 0..1 x -1..1
+    x=[i/float(n) for i in range(n)]
+    y=[math.sin(40*q)*math.cos(7*q) for q in x]
+    return x,y
+
+#WORKLOADS
+#each function draws into a new svg_class and returns it, unclosed
+
+def pathdata_list(n):
+    a=newsvg()
+    a.scale(0.,1.,-1.,1.)
+    x,y=series(n)
+    b=[]
+    for i in range(n): b+=[x[i],y[i]]
+    a.path(d=a.pathdata('M',b[:2],'L',b[2:])) #written, so that the bytes are those of the pathdata
+    return a
+
+def draw_list(n):
+    a=newsvg()
+    a.scale(0.,1.,-1.,1.)
+    x,y=series(n)
+    b=[]
+    for i in range(n): b+=[x[i],y[i]]
+    a.draw(b,stroke='red')
+    return a
+
+def draw_numpy(n):
+    a=newsvg()
+    a.scale(0.,1.,-1.,1.)
+    x,y=series(n)
+    a.draw(x=numpy.array(x),y=numpy.array(y),stroke='red')
+    return a
+
+def circles(n):
+    a=newsvg()
+    a.scale()
+    for i in range(n): a.circle((i%97)/97.,(i%89)/89.,3,fill='red',stroke='none')
+    return a
+
+def texts(n):
+    a=newsvg()
+    a.scale()
+    for i in range(n): a.text((i%97)/97.,(i%89)/89.,i%90,'%d' % i,text_anchor='middle')
+    return a
+
+def scatter(n):
+    a=newsvg()
+    a.scale()
+    a.scatter([(i%997)/997. for i in range(n)],[(i%991)/991. for i in range(n)],'square',2,fill='blue')
+    return a
+
+def windbarbs(n): #n x n grid, one windbarb at a time
+    a=newsvg()
+    a.scale()
+    for i in range(n):
+        for j in range(n):
+            a.windbarb((i+.5)/n,(j+.5)/n,(7*i+3*j)%120,(13*i+5*j)%360,15)
+    return a
+
+def windbarb_field(n): #n x n grid, all at once
+    a=newsvg()
+    a.scale()
+    x=[(i+.5)/n for i in range(n) for j in range(n)]
+    y=[(j+.5)/n for i in range(n) for j in range(n)]
+    s=[float((7*i+3*j)%120) for i in range(n) for j in range(n)]
+    d=[float((13*i+5*j)%360) for i in range(n) for j in range(n)]
+    a.windbarb_field(x,y,s,d,15)
+    return a
+
+def pcolor(n): #n x n cells of a smooth field, as paths
+    a=newsvg()
+    a.scale()
+    e=numpy.linspace(0.,1.,n+1)
+    x,y=numpy.meshgrid(e[:-1],e[:-1])
+    a.pcolor(e,e,numpy.sin(6*x)*numpy.cos(5*y)+.1*numpy.sin(90*x*y),png=False)
+    return a
+
+def contour(n): #isolines and filled contours of an n x n field, 10 levels
+    a=newsvg()
+    a.scale(-1.,1.,-1.,1.)
+    e=numpy.linspace(-1.,1.,n)
+    x,y=numpy.meshgrid(e,e)
+    f=numpy.sin(3*x)*numpy.cos(4*y)+x*y
+    a.contourf(e,e,f,10)
+    a.contour(e,e,f,10,labels=True)
+    return a
+
+def axes(n): #n pairs of axes with 50 ticks each
+    a=newsvg()
+    a.scale()
+    for i in range(n):
+        a.xaxis(dx=.02)
+        a.yaxis(dy=.02)
+    return a
+
+def composite(n): #n figures with most of the primitives of SVGtest
+    for i in range(n):
+        a=newsvg()
+        a.scale()
+        a.group(fill='black')
+        a.yaxis()
+        a.xaxis(dx=.2,form='%9.2e')
+        a.group()
+        a.path('M',200,300,'l',50,50,'l',-50,50,'l',-50,-50,'l',50,-50,'Z',fill='rgb(100,150,200)',stroke_width=5)
+        a.circle(.5,.3,20,stroke='none')
+        a.line(.5,.5,.4,.5)
+        a.fatarrow(.5,.5,.7,.5,10,fill='green',stroke='none')
+        a.arrow(.5,.5,.7,.4,10,stroke_width=3,stroke='maroon',fill='black')
+        a.poly(.9,.1,1.,.2,1.,.3,.9,.4,fill='silver',stroke='none')
+        a.draw(.9,.1,1.,.2,1.,.3,.9,.4,stroke_width=3)
+        a.arc(.8,.65,60,20,245,stroke='purple',stroke_width=15)
+        a.radial(.8,.65,60,80,132.5,stroke='purple',stroke_width=15)
+        a.sector(.7,.85,30,100,10,45,fill='red',stroke='black')
+        a.rect(.7,.8,.35,.25,fill='none',stroke='aqua',stroke_width=3)
+        a.rect2(.72,.82,1.03,1.03,fill='none',stroke='yellow',stroke_width=5)
+        a.text(.5,.3,60,'again',font_size="48pt",text_anchor='middle')
+        a.windbarb(.20,.80,107,10,80,stroke_width=1)
+        if i<n-1:
+            with contextlib.redirect_stdout(io.StringIO()): a.close()
+    return a
+
+#(name, function, argument, needs numpy, left out by --quick)
+workloads=[
+    ('pathdata_list_1e3',pathdata_list,1000,False,False),
+    ('pathdata_list_1e4',pathdata_list,10000,False,False),
+    ('pathdata_list_1e5',pathdata_list,100000,False,False),
+    ('draw_list_1e3',draw_list,1000,False,False),
+    ('draw_list_1e5',draw_list,100000,False,False),
+    ('draw_list_1e6',draw_list,1000000,False,True),
+    ('draw_numpy_1e3',draw_numpy,1000,True,False),
+    ('draw_numpy_1e4',draw_numpy,10000,True,False),
+    ('draw_numpy_1e5',draw_numpy,100000,True,False),
+    ('draw_numpy_1e6',draw_numpy,1000000,True,True),
+    ('circle_5000',circles,5000,False,False),
+    ('text_5000',texts,5000,False,False),
+    ('scatter_50000',scatter,50000,False,False),
+    ('windbarb_40x40',windbarbs,40,False,False),
+    ('windbarb_field_200x200',windbarb_field,200,False,True),
+    ('pcolor_500x500',pcolor,500,True,False),
+    ('contour_1000x1000',contour,1000,True,True),
+    ('axes_20',axes,20,False,False),
+    ('composite_20',composite,20,False,False),
+    ]
+
+def run(f,arg): #renders once, returns (seconds, output bytes)
+    with contextlib.redirect_stdout(io.StringIO()):
+        t=time.perf_counter()
+        a=f(arg)
+        a.close()
+        t=time.perf_counter()-t
+    return t,len(a.fname.getvalue())
+
+def peak(f,arg): #peak memory in bytes allocated while rendering once
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            a=f(arg)
+            a.close()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def bench(only=None,quick=False,repeat=3,memory=True):
+    results={}
+    for name,f,arg,needsnumpy,large in workloads:
+        if only and not [q for q in only if q in name]: continue
+        if quick and large: continue
+        if needsnumpy and numpy is None:
+            sys.stdout.write("%-24s skipped, needs numpy\n" % name)
+            continue
+        times=[]
+        for r in range(repeat):
+            t,size=run(f,arg)
+            times.append(t)
+        res={'time':min(times),'bytes':size}
+        if memory: res['peak']=peak(f,arg)
+        results[name]=res
+        sys.stdout.write("%-24s %10.4f s %12d bytes %s\n" % (name,res['time'],size,
+            "%10.1f MB peak" % (res['peak']/1e6) if memory else ""))
+    return {'meta':{'python':platform.python_version(),'platform':platform.platform(),
+                'numpy':numpy.__version__ if numpy is not None else None,'date':time.strftime('%Y-%m-%d %H:%M:%S')},
+            'results':results}
+
+def compare(new,base,tolerance=.2,memtolerance=.2,bytetolerance=0.): #returns list of regressions
+    regressions=[]
+    sys.stdout.write("%-24s %10s %10s %10s\n" % ('workload','time','peak','bytes'))
+    for name,r in sorted(new['results'].items()):
+        b=base['results'].get(name)
+        if b is None:
+            sys.stdout.write("%-24s not in baseline\n" % name)
+            continue
+        ratios=[]
+        for q,tol in (('time',tolerance),('peak',memtolerance),('bytes',bytetolerance)):
+            if q not in r or q not in b or not b[q]:
+                ratios.append("%10s" % '-')
+                continue
+            x=float(r[q])/b[q]
+            flag=""
+            if x>1.+tol:
+                flag="!"
+                regressions.append((name,q,b[q],r[q]))
+            ratios.append("%9.2f%s" % (x,flag or " "))
+        sys.stdout.write("%-24s %s\n" % (name," ".join(ratios)))
+    return regressions
+
+def main(argv=None):
+    p=argparse.ArgumentParser(description="headless benchmarks of simpleSVG: time, peak memory and output bytes")
+    p.add_argument('--save',metavar='JSON',help="write the results to this file, as a baseline")
+    p.add_argument('--compare',metavar='JSON',help="compare the results with this baseline")
+    p.add_argument('--tolerance',type=float,default=.2,help="allowed relative increase of time (default .2)")
+    p.add_argument('--memtolerance',type=float,default=.2,help="allowed relative increase of peak memory (default .2)")
+    p.add_argument('--bytetolerance',type=float,default=0.,help="allowed relative increase of output bytes (default 0)")
+    p.add_argument('--only',action='append',help="run workloads whose name contains this, may be repeated")
+    p.add_argument('--repeat',type=int,default=3,help="runs per workload, the fastest is kept (default 3)")
+    p.add_argument('--quick',action='store_true',help="leave out the largest workloads")
+    p.add_argument('--nomemory',action='store_true',help="do not measure peak memory")
+    a=p.parse_args(argv)
+    new=bench(a.only,a.quick,a.repeat,not a.nomemory)
+    if a.save:
+        with open(a.save,'w') as f: json.dump(new,f,indent=1,sort_keys=True)
+    if a.compare:
+        with open(a.compare) as f: base=json.load(f)
+        regressions=compare(new,base,a.tolerance,a.memtolerance,a.bytetolerance)
+        for name,q,b,r in regressions:
+            sys.stdout.write("REGRESSION %s %s: %s -> %s\n" % (name,q,b,r))
+        if regressions: return 1
+    return 0
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# test_simpleSVG.py holds smoke tests for simpleSVG.py, e.g. in Linux: python -m pytest -q test_simpleSVG.py
+####
+
+import io,os,shutil,tempfile
+import xml.etree.ElementTree as ET
+import simpleSVG
+try:
+    import numpy
+except ImportError:
+    numpy=None
+
+def drawall(a): #every primitive of svg_class, once
+    a.scale()
+    a.group(fill='black')
+    a.xaxis(dx=.2)
+    a.yaxis(dy=.2)
+    a.group()
+    a.path('M',.1,.1,'L',.2,.2,'l',10,0,'Z')
+    a.rect(.1,.1,.2,.2)
+    a.rect2(.1,.1,.2,.2)
+    a.poly(.1,.1,.2,.1,.2,.2)
+    a.draw(.1,.1,.2,.1,.2,.2)
+    a.circle(.5,.5,10)
+    a.line(.1,.9,.9,.1)
+    a.text(.5,.5,30,'label',text_anchor='middle')
+    a.sector(.5,.5,10,20,30,60)
+    a.radial(.5,.5,10,20,30)
+    a.arc(.5,.5,20,10,200)
+    a.square(.3,.3,3)
+    a.arrow(.2,.2,.4,.3,10)
+    a.fatarrow(.2,.6,.4,.7,5)
+    a.windbarb(.8,.8,45,30,20)
+    a.image(.1,.9,'picture.png',width=20,height=20)
+    a.scatter([.1,.5,.9],[.9,.5,.1],'square',3)
+    a.windbarb_field([.2,.4],[.2,.4],[15.,65.],[0.,90.],15)
+    if numpy is not None:
+        e=numpy.linspace(0.,1.,11)
+        x,y=numpy.meshgrid(e,e)
+        a.pcolor(e,e,(x*y)[:-1,:-1])
+        a.contour(e,e,x*y,3,labels=True)
+        a.contourf(e,e,x*y,3)
+
+def test_tiles_all_primitives():
+    a=simpleSVG.svg_class(io.StringIO(),verbose=False,tiles=2)
+    drawall(a)
+    d=tempfile.mkdtemp()
+    try:
+        names=a.write_tiles(d,workers=0)
+        assert os.path.join(d,'0','0','0.svg') in names
+        for q in names: ET.parse(q) #well formed
+    finally:
+        shutil.rmtree(d)
+    assert [q for q in a.tileitems if q[0] is not None] #items with boxes were indexed
+    b=simpleSVG.svg_class(io.StringIO(),verbose=False) #the document itself is the same without tiles
+    drawall(b)
+    b.close()
+    assert a.fname.getvalue()==b.fname.getvalue()
+
+def test_culled_windbarbs():
+    a=simpleSVG.svg_class(io.StringIO(),verbose=False)
+    a.scale(cull=True)
+    a.windbarb(.5,.5,47,30,50)
+    a.windbarb(.5,.5,1,30,50) #calm
+    a.windbarb(5.,5.,47,30,50) #outside of the plot area
+    a.windbarb_field([.2,.4,9.],[.2,.4,9.],[15.,65.,25.],[0.,90.,0.],15)
+    a.close()
+    t=a.fname.getvalue()
+    assert t.count('rotate(')==4 #the outside barbs are left out
+    root=ET.fromstring(t.encode())
+    ns='{http://www.w3.org/2000/svg}'
+    barbs=[g for g in root.iter(ns+'g') if 'rotate(' in g.get('transform','')]
+    assert len(barbs)==2 and all([len(g) for g in barbs]) #the glyphs were drawn
+    glyphs=[g for g in root.iter(ns+'g') if g.get('id')]
+    assert len(glyphs)==2 and all([len(g) for g in glyphs])
+
+def document(draw,**k): #the text of a document drawn by draw(a)
+    a=simpleSVG.svg_class(io.StringIO(),verbose=False,**k)
+    a.scale()
+    draw(a)
+    a.close()
+    return a.fname.getvalue()
+
+def test_draw_arrays_as_lists():
+    if numpy is None: return
+    x=numpy.linspace(0.,1.,101)
+    y=x*x
+    b=[q for p in zip(x.tolist(),y.tolist()) for q in p] #interleaved x,y
+    for cull in (False,True):
+        for f in ('draw','poly'):
+            ref=document(lambda a:(a.scale(cull=cull),getattr(a,f)(b)))
+            assert document(lambda a:(a.scale(cull=cull),getattr(a,f)(numpy.column_stack((x,y)))))==ref
+            assert document(lambda a:(a.scale(cull=cull),getattr(a,f)(x=x,y=y)))==ref
+            assert document(lambda a:(a.scale(cull=cull),getattr(a,f)(x=x.tolist(),y=y.tolist())))==ref
+    ref=document(lambda a:a.draw([.1,.5],[.2,.6])) #positional arrays are interleaved points, as lists are
+    assert document(lambda a:a.draw(numpy.array([.1,.5]),numpy.array([.2,.6])))==ref
+
+def test_parallel_paths():
+    if numpy is None: return
+    threshold,chunk=simpleSVG.parallel_threshold,simpleSVG.parallel_chunk
+    simpleSVG.parallel_threshold,simpleSVG.parallel_chunk=1000,300 #small enough for a test
+    try:
+        x=numpy.linspace(0.,1.,5001)
+        y=numpy.sin(40*x)*.5+.5
+        draw=lambda a:(a.draw(x=x,y=y),a.path('M',numpy.column_stack((x,y)),'Z'))
+        assert document(draw,workers=2)==document(draw)
+    finally:
+        simpleSVG.parallel_threshold,simpleSVG.parallel_chunk=threshold,chunk
+
+if __name__=='__main__':
+    test_tiles_all_primitives()
+    test_culled_windbarbs()
+    test_draw_arrays_as_lists()
+    test_parallel_paths()
+    print("ok")